@@ -40,4 +40,6 @@ class DataError(PycommError):
     ...
 
 
+from .tag import Tag, TagInfo, TagDatabase, LazyTag, changed_tags
 from .clx import LogixDriver
+from .scheduler import ScanScheduler, ScanClass, Subscription
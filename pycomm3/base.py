@@ -24,6 +24,7 @@
 # SOFTWARE.
 #
 
+import threading
 from os import getpid, urandom
 
 from autologging import logged
@@ -46,12 +47,14 @@ def get_bit(value, idx):
 @logged
 class Base:
     _sequence = 0
+    _sequence_lock = threading.RLock()  # drivers in other threads share the sequence, e.g. the upload connections
 
     def __init__(self, direct_connection=False, debug=False):
-        if Base._sequence == 0:
-            Base._sequence = getpid()
-        else:
-            Base._sequence = Base._get_sequence()
+        with Base._sequence_lock:
+            if Base._sequence == 0:
+                Base._sequence = getpid()
+            else:
+                Base._sequence = Base._get_sequence()
 
         self.__sock = None
         self.__direct_connections = direct_connection
@@ -132,11 +135,12 @@ class Base:
 
         :return: The New sequence
         """
-        if Base._sequence < 65535:
-            Base._sequence += 1
-        else:
-            Base._sequence = getpid() % 65535
-        return Base._sequence
+        with Base._sequence_lock:
+            if Base._sequence < 65535:
+                Base._sequence += 1
+            else:
+                Base._sequence = getpid() % 65535
+            return Base._sequence
 
     def nop(self):
         """ No replay command
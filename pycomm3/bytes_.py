@@ -25,6 +25,8 @@
 #
 
 import struct
+import sys
+from array import array
 
 
 def pack_sint(n):
@@ -60,6 +62,11 @@ def pack_real(r):
     return struct.pack('<f', r)
 
 
+def pack_lreal(r):
+    """pack a float into 8 bytes little endian"""
+    return struct.pack('<d', r)
+
+
 def pack_lint(l):
     """unpack 4 bytes little endian to int"""
     return struct.pack('<q', l)
@@ -110,6 +117,11 @@ def unpack_real(st):
     return float(struct.unpack('<f', st[0:4])[0])
 
 
+def unpack_lreal(st):
+    """unpack 8 bytes little endian to float"""
+    return float(struct.unpack('<d', st[0:8])[0])
+
+
 def unpack_lint(st):
     """unpack 4 bytes little endian to int"""
     return int(struct.unpack('<q', st[0:8])[0])
@@ -128,6 +140,25 @@ def unpack_ulong(st):
     return int(struct.unpack('<L', st[0:4])[0])
 
 
+def unpack_array(data, typ):
+    """unpack a little endian buffer of `typ` elements into an array.array"""
+    values = array(ARRAY_TYPECODE[typ])
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def pack_array(values, typ):
+    """pack a sequence of `typ` values into a little endian buffer"""
+    typecode = ARRAY_TYPECODE[typ]
+    if not isinstance(values, array) or values.typecode != typecode or sys.byteorder == 'big':
+        values = array(typecode, values)  # copy on big endian hosts so the callers array isn't swapped
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
 def print_bytes_line(msg):
     out = ''
     for ch in msg:
@@ -162,6 +193,7 @@ PACK_DATA_FUNCTION = {
     'USINT': pack_usint,  # Unsigned Byte Integer
     'DINT': pack_dint,    # Signed 32-bit integer
     'REAL': pack_real,    # 32-bit floating point
+    'LREAL': pack_lreal,  # 64-bit floating point
     'LINT': pack_lint,
     'BYTE': pack_sint,     # byte string 8-bits
     'WORD': pack_uint,     # byte string 16-bits
@@ -178,6 +210,7 @@ UNPACK_DATA_FUNCTION = {
     'USINT': unpack_usint,  # Unsigned Byte Integer
     'DINT': unpack_dint,    # Signed 32-bit integer
     'REAL': unpack_real,    # 32-bit floating point,
+    'LREAL': unpack_lreal,  # 64-bit floating point
     'LINT': unpack_lint,
     'BYTE': unpack_sint,     # byte string 8-bits
     'WORD': unpack_uint,     # byte string 16-bits
@@ -194,6 +227,7 @@ DATA_FUNCTION_SIZE = {
     'UINT': 2,    # Unsigned 16-bit integer
     'DINT': 4,    # Signed 32-bit integer
     'REAL': 4,    # 32-bit floating point
+    'LREAL': 8,   # 64-bit floating point
     'LINT': 8,
     'BYTE': 1,     # byte string 8-bits
     'WORD': 2,     # byte string 16-bits
@@ -202,6 +236,25 @@ DATA_FUNCTION_SIZE = {
 }
 
 
+# array.array type codes, used to (un)pack arrays of atomic types in bulk
+ARRAY_TYPECODE = {
+    'SINT': 'b',
+    'USINT': 'B',
+    'INT': 'h',
+    'UINT': 'H',
+    'DINT': 'i',
+    'UDINT': 'I',
+    'REAL': 'f',
+    'LREAL': 'd',
+    'LINT': 'q',
+    'ULINT': 'Q',
+    'BYTE': 'b',
+    'WORD': 'H',
+    'DWORD': 'i',
+    'LWORD': 'q'
+}
+
+
 UNPACK_PCCC_DATA_FUNCTION = {
     'N': unpack_int,
     'B': unpack_int,
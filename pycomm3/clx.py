@@ -24,19 +24,36 @@
 # SOFTWARE.
 #
 
+import os
+import pickle
+import re
 import struct
-from collections import defaultdict
+import time
+import weakref
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate, groupby
+from operator import itemgetter
+from queue import Queue
 from autologging import logged
 
-from . import DataError
+from . import DataError, CommError
 from .base import Base
 from .bytes_ import (pack_dint, pack_uint, pack_udint, pack_usint, unpack_usint, unpack_uint, unpack_dint, unpack_udint,
-                     UNPACK_DATA_FUNCTION, PACK_DATA_FUNCTION, DATA_FUNCTION_SIZE)
+                     UNPACK_DATA_FUNCTION, PACK_DATA_FUNCTION, DATA_FUNCTION_SIZE, ARRAY_TYPECODE, pack_array,
+                     unpack_array)
 from .const import (SUCCESS, EXTENDED_SYMBOL, ENCAPSULATION_COMMAND, DATA_TYPE, SERVICE_STATUS, BITS_PER_INT_TYPE,
                     REPLAY_INFO, TAG_SERVICES_REQUEST, PADDING_BYTE, ELEMENT_ID, DATA_ITEM, ADDRESS_ITEM,
                     CLASS_ID, CLASS_CODE, INSTANCE_ID, INSUFFICIENT_PACKETS, REPLY_START,
                     MULTISERVICE_READ_OVERHEAD, MULTISERVICE_WRITE_OVERHEAD, MIN_VER_INSTANCE_IDS, REQUEST_PATH_SIZE,
-                    VENDORS, PRODUCT_TYPES, KEYSWITCH)
+                    VENDORS, PRODUCT_TYPES, KEYSWITCH, STRUCTURE_READ_REPLY, MULTISERVICE_READ_REPLY_OVERHEAD,
+                    MULTISERVICE_REQUEST_HEADER, TAG_CACHE_VERSION, TEMPLATE_ATTRIBUTES_REPLY_SIZE,
+                    SYMBOL_ATTRIBUTES_REPLY_SIZE, EMBEDDED_SERVICE_ERROR, MULTI_SERVICE_REPLY)
+from .metadata import ControllerMetadata, attach_metadata, detach_metadata
+from .scheduler import ScanScheduler, Subscription
+from .snapshot import TagSnapshot, write_snapshot
+from .tag import Tag, TagInfo, LazyTag, TagDatabase, status_error
+from .udt import StructLayout, STRING_LAYOUT, is_hidden_member, decode_string
 
 
 @logged
@@ -59,21 +76,49 @@ class LogixDriver(Base):
         - CompactLogix 5370
         - ControlLogix 5572 and 1756-EN2T Module
 
+    If `tag_cache` is set to a directory, the tag list and the structure templates uploaded by `get_tag_list` are
+    saved to a cache file in it, keyed by the serial number, firmware revision and program name of the controller.
+    The next time the tag list is requested for the same controller the cache is loaded instead of uploading
+    everything again.  Delete the file (or use `get_tag_list(..., refresh=True)`) after changing the tags in the
+    program without changing its name.  The cache is a pickle file, only load caches that you created.
+
+    If `lazy_udts` is True, `get_tag_list` only uploads the list of symbols, the structure definitions are uploaded
+    the first time a tag of that type is read, written or looked up in `tags`.
+
+    `get_tag_list('*')` uploads the tags of the programs concurrently, using up to `upload_connections` connections
+    to the controller (this one and `upload_connections - 1` extra connections opened for the upload).  Set it to 1
+    to upload them one program at a time over this connection.
+
+    Drivers in the same process connected to the same controller (IP address and slot) share the uploaded templates
+    and the tag list, only the first driver uploads them, the others only check that the tag list hasn't changed.
+    A driver stops sharing the caches when it's closed (or deleted) and shares them again when it's opened, the shared
+    caches are released when no driver for the controller uses them.  Set `shared_metadata` to False to keep separate
+    caches for this driver.
+
 """
 
-    def __init__(self, ip_address, *args, slot=0, large_packets=True, init_info=True, init_tags=True, **kwargs):
+    def __init__(self, ip_address, *args, slot=0, large_packets=True, init_info=True, init_tags=True,
+                 tag_cache=None, lazy_udts=False, upload_connections=4, shared_metadata=True, **kwargs):
         super().__init__(*args, **kwargs)
-        self._instance_id_cache = {}
-        self._struct_cache = {}
-        self._template_cache = {}
-        self._udt_cache = {}
+        self._init_args = (args, kwargs)  # used to open the upload connections
+        self._tag_cache = os.path.expanduser(tag_cache) if tag_cache is not None else None
+        self._metadata_key = (ip_address, slot) if shared_metadata else None
+        self._metadata_release = None  # detaches the driver from the shared metadata, also called when it's deleted
+        self._use_metadata(ControllerMetadata())
+        self._attach_metadata()
         self._program_names = []
+        self._tag_list_scope = None  # the program argument of get_tag_list for the cached tag list
+        self._symbol_probes = {}  # {program: (max instance, number of instances)} of the Symbol class when uploaded
         self.attribs['ip address'] = ip_address
         self.attribs['cpu slot'] = slot
         self.attribs['extended forward open'] = large_packets
         self._connection_size = 4000 if large_packets else 500
-        self._tags = {}
+        self._tags = TagDatabase(resolve=self._resolve_udt)
         self.use_instance_ids = True
+        self.lazy_udts = lazy_udts
+        self.upload_connections = upload_connections
+        self._scheduler = None
+        self._subscriptions = 0
 
         if init_tags or init_info:
             self.open()
@@ -84,7 +129,45 @@ class LogixDriver(Base):
 
             if init_tags:
                 self.get_tag_list()
-            self.close()
+            super().close()  # still sharing the metadata, the driver is usually opened again right away
+
+    def open(self):
+        self._attach_metadata()
+        return super().open()
+
+    def close(self):
+        if self._scheduler is not None:
+            self._scheduler.stop()
+        try:
+            return super().close()
+        finally:
+            self._detach_metadata()
+
+    def _attach_metadata(self, replace=False):
+        """ share the metadata of the controller with the other drivers, if enabled and not already attached """
+        if self._metadata_key is not None and self._metadata_release is None:
+            self._use_metadata(attach_metadata(self._metadata_key, self._metadata, replace))
+            self._metadata_release = weakref.finalize(self, detach_metadata, self._metadata_key, self._metadata)
+
+    def _detach_metadata(self):
+        """ stop sharing the metadata, the driver keeps using the caches it has """
+        if self._metadata_release is not None:
+            self._metadata_release()
+            self._metadata_release = None
+
+    def _use_metadata(self, metadata):
+        self._metadata = metadata
+        self._instance_id_cache = metadata.instance_ids
+        self._struct_cache = metadata.structs
+        self._template_cache = metadata.templates
+        self._udt_cache = metadata.udts
+        self._layout_cache = metadata.layouts
+        self._struct_handles = metadata.struct_handles
+
+    def _cache(self, cache, key, value):
+        """ add `value` to a metadata cache, unless another driver added it first, and return the cached value """
+        with self._metadata.lock:
+            return cache.setdefault(key, value)
 
     def _check_reply(self, reply):
         """ check the replayed message for error"""
@@ -111,6 +194,10 @@ class LogixDriver(Base):
                     return True
             elif typ == unpack_uint(ENCAPSULATION_COMMAND["send_unit_data"]):
                 status = _unit_data_status(reply)
+                # a multiple service packet with failed services is still valid, the status of each service is
+                # in its own reply and is checked when the replies are parsed
+                if status == EMBEDDED_SERVICE_ERROR and reply[REPLY_START - 4] == MULTI_SERVICE_REPLY:
+                    return True
                 if status not in (INSUFFICIENT_PACKETS, SUCCESS):
                     self._status = (3, f"send_unit_data reply:{SERVICE_STATUS[status]} - "
                     f"Extend status:{self.get_extended_status(reply, 48)}")
@@ -155,11 +242,12 @@ class LogixDriver(Base):
         if tags:
             base, *attrs = tags
 
-            if self.use_instance_ids and base in self._instance_id_cache:
+            instance_id = self._instance_id_cache.get(base) if self.use_instance_ids else None
+            if instance_id is not None:
                 rp = [CLASS_ID['8-bit'],
                       CLASS_CODE['Symbol Object'],
                       INSTANCE_ID['16-bit'], b'\x00',
-                      pack_uint(self._instance_id_cache[base])]
+                      pack_uint(instance_id)]
             else:
                 base_tag, index = self._find_tag_index(base)
                 base_len = len(base_tag)
@@ -199,7 +287,7 @@ class LogixDriver(Base):
 
         return None
 
-    def read_tag(self, *tags):
+    def read_tag(self, *tags, columns=False, lazy=False):
         """ read tag from a connected plc
 
         Possible combination can be passed to this method:
@@ -210,7 +298,14 @@ class LogixDriver(Base):
         At the moment there is not a strong validation for the argument passed. The user should verify
         the correctness of the format passed.
 
-        :return: None is returned in case of error otherwise the tag list is returned
+        :param columns: return the results as columns instead of a tuple for each tag, a dict of
+                        {'tag': [...], 'value': [...], 'type': [...], 'status': [...], 'timestamp': float}
+                        where status is the general status of each read and timestamp is when the last reply
+                        was received (from time.time()), it can be passed straight to pandas.DataFrame
+        :param lazy: return LazyTag results, values are only decoded when they are accessed and the raw values
+                     can be compared to find the tags that changed without decoding them (see `changed_tags`)
+        :return: a Tag (tag, value, type, error) for a single tag or a list of them for multiple tags, in the same
+                 order as `tags`
         """
         self.clear()
 
@@ -220,40 +315,117 @@ class LogixDriver(Base):
                 self.__log.warning(self._status)
                 raise DataError(self._status[1])
 
-        if len(tags) == 1:
-            if isinstance(tags[0], (list, tuple)):
-                return self._read_tag_multi(tags[0])
-            else:
-                return self._read_tag_single(tags[0])
-        else:
-            return self._read_tag_multi(tags)
+        if len(tags) == 1 and isinstance(tags[0], (list, tuple)):
+            tags = tags[0]
+        elif len(tags) == 1 and not (columns or lazy):
+            return self._read_tag_single(tags[0])
+
+        return self._read_tag_multi(tags, columns=columns, lazy=lazy)
 
-    def _read_tag_multi(self, tags):
-        tag_bits = defaultdict(list)
+    @property
+    def scheduler(self):
+        """ the `ScanScheduler` used by `subscribe`, created the first time it's used """
+        if self._scheduler is None:
+            self._scheduler = ScanScheduler(self)
+        return self._scheduler
+
+    def subscribe(self, tags, callback, period=1.0, deadband=None, percent=False):
+        """
+        read `tags` every `period` seconds and call `callback` with the results (LazyTag) of only the tags that
+        changed, all the tags are included the first time.  Subscriptions are scan classes of `scheduler`, which is
+        started in a background thread, while it's running the driver should only be used from the callbacks.
+
+        :param tags: list of tag names
+        :param callback: callable(results) called from the scheduler thread
+        :param period: time between reads, in seconds
+        :param deadband: REAL and LREAL tags are only reported if they changed by more than `deadband` since their
+                         last reported value, other types are reported on any change
+        :param percent: `deadband` is a percentage of the last reported value
+        :return: the Subscription, use its `cancel` method to stop it
+        """
+        self._subscriptions += 1
+        name = f'subscription {self._subscriptions}'
+        subscription = Subscription(self.scheduler, name, callback, deadband, percent)
+        self.scheduler.add_scan_class(name, period, tags, subscription)
+        self.scheduler.start()
+        return subscription
+
+    def _read_tag_multi(self, tags, sizes=None, columns=False, lazy=False, strings=False):
+        """
+        :param sizes: optional dict of {tag: size of the value}, used in place of the size from the tag list
+        :param columns: return the results as columns, see `read_tag`
+        :param lazy: return LazyTag results, see `read_tag`
+        :param strings: decode structures with an unknown template as strings, see `read_strings`
+        """
+        self._prefetch_templates(tags)
+        tag_bits = {}  # bits of the same integer share a single read, {tag: (service, bits)}
+        services = []  # number of results of each service, in the order they're sent
+        order = []  # (service, result of the service) of each tag in `tags`
         rp_list, tags_read = [[]], [[]]
         request_len = 0
+        reply_len = MULTISERVICE_READ_REPLY_OVERHEAD
         for tag in tags:
             tag, bit = self._prep_bools(tag, 'BOOL', bits_only=True)
             read = bit is None or tag not in tag_bits
+            bits = None
+            if read:
+                if bit is not None:
+                    tag_bits[tag] = (len(services), [])
+                services.append(0)
             if bit is not None:
-                tag_bits[tag].append(bit)
+                service, bits = tag_bits[tag]
+                bits.append(bit)
+            else:
+                service = len(services) - 1
+            order.append((service, services[service]))
+            services[service] += 1
             if read:
+                size = sizes.get(tag) if sizes else None
+                tag_reply_len = (size or self._estimate_read_size(tag)) + MULTISERVICE_READ_REPLY_OVERHEAD
+                if bit is None and tag_reply_len + MULTISERVICE_READ_REPLY_OVERHEAD >= self._connection_size:
+                    # too large for a multi-service reply, it's read on its own using fragmented reads
+                    rp_list += [None, []]
+                    tags_read += [tag, []]
+                    request_len = 0
+                    reply_len = MULTISERVICE_READ_REPLY_OVERHEAD
+                    continue
+
                 rp = self.create_tag_rp(tag, multi_requests=True)
                 if rp is None:
                     self._status = (6, f"Cannot create tag {tag} request packet. read_tag will not be executed.")
                     raise DataError(self._status[1])
                 else:
                     tag_req_len = len(rp) + MULTISERVICE_READ_OVERHEAD
-                    if tag_req_len + request_len >= self._connection_size:
+                    if (tag_req_len + request_len >= self._connection_size or
+                            tag_reply_len + reply_len >= self._connection_size) and rp_list[-1]:
                         rp_list.append([])
                         tags_read.append([])
                         request_len = 0
+                        reply_len = MULTISERVICE_READ_REPLY_OVERHEAD
                     rp_list[-1].append(bytes([TAG_SERVICES_REQUEST['Read Tag']]) + rp + b'\x01\x00')
-                    tags_read[-1].append(tag)
+                    tags_read[-1].append((tag, bits))
                     request_len += tag_req_len
+                    reply_len += tag_reply_len
 
-        replies = []
+        results = {'tag': [], 'value': [], 'type': [], 'status': [], 'timestamp': None}
+        errors = {}  # results that were read but could not be decoded, {index: error}
+        lazy_results = []
         for req_list, tags_ in zip(rp_list, tags_read):
+            if req_list is None:
+                result = self._read_tag_single(tags_)
+                results['timestamp'] = time.time()
+                if lazy and not columns:
+                    lazy_results.append(result)
+                else:
+                    if result.error is not None:
+                        errors[len(results['tag'])] = result.error
+                    results['tag'].append(result.tag)
+                    results['value'].append(result.value)
+                    results['type'].append(result.type)
+                    results['status'].append(self._status[0])
+                continue
+            if not req_list:
+                continue
             message_request = self.build_multiple_service(req_list, self._get_sequence())
             msg = self.build_common_packet_format(
                 DATA_ITEM['Connected'],
@@ -264,24 +436,85 @@ class LogixDriver(Base):
             if reply is None:
                 raise DataError("send_unit_data returned not valid data")
 
-            replies += self._parse_multiple_request_read(reply, tags_, tag_bits)
-        return replies
+            results['timestamp'] = time.time()
+            if lazy and not columns:
+                lazy_results += self._parse_multiple_request_lazy(reply, tags_)
+            else:
+                self._parse_multiple_request_read(reply, tags_, results, errors, strings)
+
+        # the results are in the order of the services, with the bits of an integer after its first bit
+        firsts = [0, *accumulate(services)]
+        positions = [firsts[service] + i for service, i in order]
+        if positions != list(range(len(positions))):
+            if lazy and not columns:
+                lazy_results = [lazy_results[i] for i in positions]
+            else:
+                for key in ('tag', 'value', 'type', 'status'):
+                    results[key] = [results[key][i] for i in positions]
+
+        if columns:
+            return results
+        if lazy:
+            return lazy_results
+        return [Tag(tag, value, typ, errors.get(position) or status_error(status))
+                for tag, value, typ, status, position in zip(results['tag'], results['value'], results['type'],
+                                                             results['status'], positions)]
 
     def _read_tag_single(self, tag):
-        tag, bit = self._prep_bools(tag, 'BOOL', bits_only=True)
-        rp = self.create_tag_rp(tag)
+        name, bit = self._prep_bools(tag, 'BOOL', bits_only=True)
+        rp = self.create_tag_rp(name)
         if rp is None:
             self._status = (6, f"Cannot create tag {tag} request packet. read_tag will not be executed.")
-            return None
+            return Tag(tag, error=self._status[1])
+
+        data_type, data = self._read_raw(rp)
+
+        # Get the data type
+        if self._status[0] == SUCCESS:
+            if data_type == STRUCTURE_READ_REPLY:
+                try:
+                    return Tag(tag, *self._decode_struct(data, name))
+                except DataError as err:
+                    return Tag(tag, error=str(err))
+            try:
+                return Tag(tag, *self._decode_value(data_type, data, bit))
+            except Exception as e:
+                raise DataError(e)
         else:
-            # Creating the Message Request Packet
-            message_request = [
-                pack_uint(self._get_sequence()),
-                bytes([TAG_SERVICES_REQUEST['Read Tag']]),  # the Request Service
-                bytes([len(rp) // 2]),  # the Request Path Size length in word
-                rp,  # the request path
-                b'\x01\x00'
-            ]
+            return Tag(tag, error=self._status[1])
+
+    def _decode_value(self, data_type, data, bit=None):
+        """
+        decode the value of a read reply
+
+        :param data_type: the data type code from the reply
+        :param data: the data following the data type, for structures starting with the structure handle
+        :param bit: the bit to return if reading a bit of an integer
+        :return: (value, data type name)
+        """
+        if data_type == STRUCTURE_READ_REPLY:
+            return self._decode_struct(data)
+
+        typ = DATA_TYPE[data_type]
+        value = UNPACK_DATA_FUNCTION[typ](data)
+        if bit is not None:
+            return (bool(value & (1 << bit)) if bit < BITS_PER_INT_TYPE[typ] else None), 'BOOL'
+        return value, typ
+
+    def _read_raw(self, rp, elements=1):
+        """
+        read the undecoded value of a tag, if the value does not fit in a single reply the rest
+        is read using Read Tag Fragmented
+
+        :return: (data type, data), for structures the data starts with the structure handle
+        """
+        message_request = [
+            pack_uint(self._get_sequence()),
+            bytes([TAG_SERVICES_REQUEST['Read Tag']]),  # the Request Service
+            bytes([len(rp) // 2]),  # the Request Path Size length in word
+            rp,  # the request path
+            pack_uint(elements)
+        ]
 
         reply = self.send_unit_data(
             self.build_common_packet_format(
@@ -293,29 +526,58 @@ class LogixDriver(Base):
         if reply is None:
             raise DataError("send_unit_data returned not valid data")
 
-            # Get the data type
-        if self._status[0] == SUCCESS:
-            data_type = unpack_uint(reply[50:52])
-            typ = DATA_TYPE[data_type]
-            try:
-                value = UNPACK_DATA_FUNCTION[typ](reply[52:])
-                if bit is not None:
-                    value = bool(value & (1 << bit)) if bit < BITS_PER_INT_TYPE[typ] else None
-                return value, typ
-            except Exception as e:
-                raise DataError(e)
-        else:
-            return None
+        data_type = unpack_uint(reply[REPLY_START:REPLY_START + 2])
+        data = reply[REPLY_START + 2:]
+        if _unit_data_status(reply) == INSUFFICIENT_PACKETS:
+            header = 4 if data_type == STRUCTURE_READ_REPLY else 2
+            data += self._read_fragmented_remainder(rp, len(data) + 2 - header, elements, header)
+
+        return data_type, data
 
-    def read_array(self, tag, counts, raw=False):
+    def _read_fragmented_remainder(self, rp, offset, elements=1, header=4):
+        """
+        finishes a read that did not fit in a single reply, reading the rest of the value with
+        Read Tag Fragmented requests starting at `offset`
+
+        :param header: size of the data type at the start of each reply, 4 for structures (type + handle)
+        """
+        data = bytearray()
+        status = INSUFFICIENT_PACKETS
+        while status == INSUFFICIENT_PACKETS:
+            message_request = [
+                pack_uint(self._get_sequence()),
+                bytes([TAG_SERVICES_REQUEST["Read Tag Fragmented"]]),
+                bytes([len(rp) // 2]),
+                rp,
+                pack_uint(elements),
+                pack_dint(offset)
+            ]
+            reply = self.send_unit_data(
+                self.build_common_packet_format(DATA_ITEM['Connected'],
+                                                b''.join(message_request),
+                                                ADDRESS_ITEM['Connection Based'],
+                                                addr_data=self._target_cid, ))
+            if reply is None:
+                raise DataError("send_unit_data returned not valid data")
+
+            status = _unit_data_status(reply)
+            fragment = reply[REPLY_START + header:]
+            data += fragment
+            offset += len(fragment)
+
+        return data
+
+    def read_array(self, tag, counts=None, raw=False, as_array=False):
         """ read array of atomic data type from a connected plc
 
         At the moment there is not a strong validation for the argument passed. The user should verify
         the correctness of the format passed.
 
         :param tag: the name of the tag to read
-        :param counts: the number of element to read
+        :param counts: the number of element to read, if None the rest of the array from `tag` is read using the
+                       array dimensions from the tag list
         :param raw: the value should output as raw-value (hex)
+        :param as_array: return the values as an `array.array` instead of a list of (index, value) tuples
         :return: None is returned in case of error otherwise the tag list is returned
         """
         self.clear()
@@ -325,9 +587,13 @@ class LogixDriver(Base):
                 self.__log.warning(self._status)
                 raise DataError(self._status[1])
 
+        if counts is None:
+            counts = self._array_elements([tag])[tag]
+
         offset = 0
         last_idx = 0
-        tags = b'' if raw else []
+        typ = None
+        tags = bytearray() if raw or as_array else []
 
         while offset != -1:
             rp = self.create_tag_rp(tag)
@@ -352,10 +618,208 @@ class LogixDriver(Base):
             if reply is None:
                 raise DataError("send_unit_data returned not valid data")
 
-            last_idx, offset = self._parse_fragment(reply, last_idx, offset, tags, raw)
+            last_idx, offset, typ = self._parse_fragment(reply, last_idx, offset, tags, raw or as_array)
+
+        if as_array:
+            try:
+                return unpack_array(tags, typ)
+            except Exception as e:
+                raise DataError(e)
 
         return tags
 
+    def read_bool_array(self, tag, count):
+        """ read bits from a BOOL array
+
+        BOOL arrays are stored as DWORDs in the controller, this reads the DWORDs containing the requested bits
+        in one (fragmented) read and expands them into a list of bools.
+
+        :param tag: the name of the BOOL array, optionally with the index of the first bit, e.g. 'Alarms[64]'
+        :param count: the number of bits to read
+        :return: list of bools, one for each bit starting at the requested index
+        """
+        if count <= 0:
+            return []
+        base, start = self._bool_array_start(tag)
+        first_bit = start % 32
+        data = self.read_array(f'{base}[{start // 32}]', (first_bit + count + 31) // 32, raw=True)
+        if data is None:
+            return None
+
+        bits = (int.from_bytes(data, 'little') >> first_bit) & ((1 << count) - 1)
+        return [bit == '1' for bit in reversed(f'{bits:0{count}b}')]
+
+    def write_bool_array(self, tag, values):
+        """ write bits to a BOOL array
+
+        The values are packed into DWORDs and written in a single (fragmented) write, DWORDs only partially
+        covered by the values are updated using Read Modify Write so the other bits are not changed.
+
+        :param tag: the name of the BOOL array, optionally with the index of the first bit, e.g. 'Alarms[64]'
+        :param values: list of the bit values to write, starting at the requested index
+        :return: True if successful
+        """
+        self.clear()
+
+        if not self._target_is_connected:
+            if not self.forward_open():
+                self._status = (9, "Target did not connected. write_bool_array will not be executed.")
+                self.__log.warning(self._status)
+                raise DataError(self._status[1])
+
+        if not values:
+            return True
+
+        base, start = self._bool_array_start(tag)
+        first_word, first_bit = divmod(start, 32)
+        num_words = (first_bit + len(values) + 31) // 32
+        bits = int(''.join('1' if v else '0' for v in reversed(values)), 2) << first_bit
+        mask = ((1 << len(values)) - 1) << first_bit
+
+        full_words = []
+        partial_words = []
+        for i in range(num_words):
+            word_mask = (mask >> (32 * i)) & 0xFFFFFFFF
+            word_bits = (bits >> (32 * i)) & 0xFFFFFFFF
+            if word_mask == 0xFFFFFFFF:
+                full_words.append(i)
+            else:
+                partial_words.append((i, word_bits, ~word_mask & 0xFFFFFFFF | word_bits))
+
+        if partial_words:
+            requests = []
+            names = []
+            for i, or_mask, and_mask in partial_words:
+                name = f'{base}[{first_word + i}]'
+                rp = self.create_tag_rp(name, multi_requests=True)
+                if rp is None:
+                    self._status = (9, f"Cannot create tag {name} request packet. write_bool_array not executed.")
+                    return None
+                requests.append(bytes([TAG_SERVICES_REQUEST["Read Modify Write Tag"]]) + rp +
+                                pack_uint(4) + pack_udint(or_mask) + pack_udint(and_mask))
+                names.append((name, or_mask, 'DWORD'))
+
+            message_request = self.build_multiple_service(requests, self._get_sequence())
+            reply = self.send_unit_data(self.build_common_packet_format(DATA_ITEM['Connected'],
+                                                                        b''.join(message_request),
+                                                                        ADDRESS_ITEM['Connection Based'],
+                                                                        addr_data=self._target_cid))
+            if reply is None:
+                raise DataError("send_unit_data returned not valid data")
+            if not all(self._parse_multiple_request_write(names, reply)):
+                self._status = (9, f"Failed to write the partial DWORDs of {tag}")
+                return False
+
+        if full_words:
+            name = f'{base}[{first_word + full_words[0]}]'
+            rp = self.create_tag_rp(name)
+            if rp is None:
+                self._status = (9, f"Cannot create tag {name} request packet. write_bool_array will not be executed.")
+                return None
+            data = (bits >> (32 * full_words[0])).to_bytes(num_words * 4, 'little')[:len(full_words) * 4]
+            return self._write_raw(rp, pack_uint(DATA_TYPE['DWORD']), data, elements=len(full_words))
+
+        return True
+
+    @staticmethod
+    def _bool_array_start(tag):
+        """ splits a BOOL array tag into the base name and index of the first bit """
+        if tag.endswith(']'):
+            base, idx = tag[:-1].rsplit('[', maxsplit=1)
+            return base, int(idx)
+        return tag, 0
+
+    def read_arrays(self, arrays, as_array=False):
+        """ read multiple arrays of atomic data types
+
+        Arrays are packed into multi-request packets, with a Read Tag service for each array.  Arrays too large to fit
+        in a single reply are read separately using `read_array`.  The size of the elements is taken from the tag list
+        if it has been uploaded, else the largest atomic size is assumed when packing requests.
+
+        :param arrays: dict of {tag name: number of elements}, or a list of tag names to read whole arrays,
+                       a number of None reads the rest of the array using the array dimensions from the tag list
+        :param as_array: return the values as `array.array` instead of lists of (index, value) tuples
+        :return: dict of {tag name: values}, values are in the same format as `read_array`, None if the read failed
+        """
+        self.clear()
+        if not self._target_is_connected:
+            if not self.forward_open():
+                self._status = (7, "Target did not connected. read_arrays will not be executed.")
+                self.__log.warning(self._status)
+                raise DataError(self._status[1])
+
+        arrays = dict(arrays) if isinstance(arrays, dict) else dict.fromkeys(arrays)
+        arrays.update(self._array_elements([tag for tag, count in arrays.items() if count is None]))
+        self._prefetch_templates(arrays)
+        results = {}
+        large_arrays = []
+        rp_list, tags_read = [[]], [[]]
+        request_len = MULTISERVICE_REQUEST_HEADER
+        reply_len = MULTISERVICE_READ_REPLY_OVERHEAD
+        for tag, count in arrays.items():
+            tag_reply_len = count * self._estimate_read_size(tag) + MULTISERVICE_READ_REPLY_OVERHEAD
+            if tag_reply_len + MULTISERVICE_READ_REPLY_OVERHEAD >= self._connection_size:
+                large_arrays.append((tag, count))
+                continue
+
+            rp = self.create_tag_rp(tag, multi_requests=True)
+            if rp is None:
+                self._status = (7, f"Cannot create tag {tag} request packet. read_arrays will not be executed.")
+                raise DataError(self._status[1])
+
+            tag_req_len = len(rp) + MULTISERVICE_READ_OVERHEAD
+            if (tag_req_len + request_len >= self._connection_size or
+                    tag_reply_len + reply_len >= self._connection_size) and rp_list[-1]:
+                rp_list.append([])
+                tags_read.append([])
+                request_len = MULTISERVICE_REQUEST_HEADER
+                reply_len = MULTISERVICE_READ_REPLY_OVERHEAD
+            rp_list[-1].append(bytes([TAG_SERVICES_REQUEST['Read Tag']]) + rp + pack_uint(count))
+            tags_read[-1].append(tag)
+            request_len += tag_req_len
+            reply_len += tag_reply_len
+
+        for req_list, tags_ in zip(rp_list, tags_read):
+            if not req_list:
+                continue
+            message_request = self.build_multiple_service(req_list, self._get_sequence())
+            reply = self.send_unit_data(self.build_common_packet_format(DATA_ITEM['Connected'],
+                                                                        b''.join(message_request),
+                                                                        ADDRESS_ITEM['Connection Based'],
+                                                                        addr_data=self._target_cid, ))
+            if reply is None:
+                raise DataError("send_unit_data returned not valid data")
+            results.update(self._parse_multiple_request_arrays(reply, tags_, as_array))
+
+        for tag, count in large_arrays:
+            results[tag] = self.read_array(tag, count, as_array=as_array)
+
+        return {tag: results.get(tag) for tag in arrays}
+
+    def _parse_multiple_request_arrays(self, reply, tags, as_array=False):
+        """ parse the reply from a multi request read of arrays, the values of each array are decoded in bulk
+
+        :return: dict of {tag: values}
+        """
+        offset = REPLY_START
+        try:
+            number_of_service_replies = unpack_uint(reply[offset:offset + 2])
+            starts = [offset + unpack_uint(reply[offset + 2 + (i * 2):offset + 4 + (i * 2)])
+                      for i in range(number_of_service_replies)]
+            results = {}
+            for tag, start, end in zip(tags, starts, starts[1:] + [len(reply)]):
+                general_status = unpack_usint(reply[start + 2:start + 3])
+                typ = DATA_TYPE.get(unpack_uint(reply[start + 4:start + 6])) if general_status == SUCCESS else None
+                if typ not in ARRAY_TYPECODE:
+                    self.__log.warning(f'Failed to read array {tag}, status: {general_status}')
+                    results[tag] = None
+                    continue
+                values = unpack_array(reply[start + 6:end], typ)
+                results[tag] = values if as_array else list(enumerate(values))
+            return results
+        except Exception as e:
+            raise DataError(e)
+
     @staticmethod
     def _prep_bools(tag, typ, bits_only=True):
         """
@@ -390,8 +854,9 @@ class LogixDriver(Base):
     def _write_tag_multi_write(self, tags):
         rp_list = [[]]
         tags_added = [[]]
+        results = [None] * len(tags)  # in the same order as `tags`
         request_len = 0
-        for name, value, typ in tags:
+        for index, (name, value, typ) in enumerate(tags):
             name, bit = self._prep_bools(name, typ, bits_only=False)  # check if bit of int or bool array
             # Create the request path to wrap the tag name
             rp = self.create_tag_rp(name, multi_requests=True)
@@ -416,7 +881,7 @@ class LogixDriver(Base):
                                    PACK_DATA_FUNCTION[typ](value))
 
                     tag_req_len = len(request) + MULTISERVICE_WRITE_OVERHEAD
-                    if tag_req_len + request_len >= self._connection_size:
+                    if rp_list[-1] and tag_req_len + request_len >= self._connection_size:
                         rp_list.append([])
                         tags_added.append([])
                         request_len = 0
@@ -424,14 +889,16 @@ class LogixDriver(Base):
                     request_len += tag_req_len
                 except (LookupError, struct.error) as e:
                     self._status = (8, f"Tag:{name} type:{typ} removed from write list. Error:{e}.")
+                    results[index] = Tag(name, value, typ, f'Invalid value or data type: {e}')
 
                     # The tag in idx position need to be removed from the rp list because has some kind of error
                 else:
-                    tags_added[-1].append((name, value, typ))
+                    tags_added[-1].append((index, (name, value, typ)))
 
         # Create the message request
-        replies = []
         for req_list, tags_ in zip(rp_list, tags_added):
+            if not req_list:  # every tag of the packet failed before it was sent
+                continue
             message_request = self.build_multiple_service(req_list, self._get_sequence())
             msg = self.build_common_packet_format(DATA_ITEM['Connected'],
                                                   b''.join(message_request),
@@ -439,10 +906,12 @@ class LogixDriver(Base):
                                                   addr_data=self._target_cid, )
             reply = self.send_unit_data(msg)
             if reply:
-                replies += self._parse_multiple_request_write(tags_, reply)
+                indexes, tags_ = zip(*tags_)
+                for index, result in zip(indexes, self._parse_multiple_request_write(tags_, reply)):
+                    results[index] = result
             else:
                 raise DataError("send_unit_data returned not valid data")
-        return replies
+        return results
 
     def _write_tag_single_write(self, tag, value, typ):
         name, bit = self._prep_bools(tag, typ,
@@ -452,7 +921,7 @@ class LogixDriver(Base):
         if rp is None:
             self._status = (8, f"Cannot create tag {tag} request packet. write_tag will not be executed.")
             self.__log.warning(self._status)
-            return None
+            return Tag(tag, value, typ, self._status[1])
         else:
             # Creating the Message Request Packet
             message_request = [
@@ -479,7 +948,7 @@ class LogixDriver(Base):
                                                                         ADDRESS_ITEM['Connection Based'],
                                                                         addr_data=self._target_cid))
             if reply:
-                return True
+                return Tag(tag, value, typ)
 
             raise DataError("send_unit_data returned not valid data")
 
@@ -525,7 +994,8 @@ class LogixDriver(Base):
         :param tag: tag name, or an array of tuple containing (tag name, value, data type)
         :param value: the value to write or none if tag is an array of tuple or a tuple
         :param typ: the type of the tag to write or none if tag is an array of tuple or a tuple
-        :return: None is returned in case of error otherwise the tag list is returned
+        :return: a Tag (tag, value, type, error) for a single tag or a list of them for multiple tags,
+                 error is None if the write succeeded (the Tag is truthy)
         """
         self.clear()  # cleanup error string
 
@@ -544,17 +1014,102 @@ class LogixDriver(Base):
                 name = tag
             return self._write_tag_single_write(name, value, typ)
 
+    def write_udt(self, tag, value):
+        """ write a whole structure tag in a single request
+
+        The value is encoded into the byte image of the structure using its template, so the template must be known
+        (the tag list must have been uploaded).  If the value is larger than the connection size, it will be written
+        using Write Tag Fragmented.  Members not included in the value will keep their current value, this requires
+        reading the current value of the structure first.
+
+        :param tag: the name of the structure tag (or structure member) to write
+        :param value: dict of {member name: value}, nested structures as dicts and arrays as lists
+        :return: True if successful
+        """
+        self.clear()
+
+        if not self._target_is_connected:
+            if not self.forward_open():
+                self._status = (8, "Target did not connected. write_udt will not be executed.")
+                self.__log.warning(self._status)
+                raise DataError(self._status[1])
+
+        udt = self._get_tag_udt(tag)
+        if udt is None:
+            self._status = (8, f"{tag} is not a known structure, the tag list must be uploaded to write a structure")
+            raise DataError(self._status[1])
+
+        rp = self.create_tag_rp(tag)
+        if rp is None:
+            self._status = (8, f"Cannot create tag {tag} request packet. write_udt will not be executed.")
+            self.__log.warning(self._status)
+            return None
+
+        layout = self._get_layout(udt['template_instance_id'])
+        data = None
+        if not layout.is_complete(value):
+            _, current = self._read_raw(rp)
+            data = bytearray(current[2:2 + layout.size])  # skip the structure handle
+
+        image = layout.encode(value, data)
+        return self._write_raw(rp, pack_uint(STRUCTURE_READ_REPLY) + pack_uint(layout.handle), image)
+
+    def _write_raw(self, rp, data_type, data, elements=1, alignment=4):
+        """
+        write an encoded value using Write Tag, or Write Tag Fragmented if it does not fit in the connection size
+
+        :param data_type: the encoded data type, for structures this includes the structure handle
+        :param alignment: fragment sizes are a multiple of this, so fragments don't split elements
+        """
+        # sequence + service + path size + path + data type + number of elements
+        request_size = 4 + len(rp) + len(data_type) + 2
+
+        if request_size + len(data) <= self._connection_size:
+            self._send_write(TAG_SERVICES_REQUEST['Write Tag'], rp, [data_type, pack_uint(elements), data])
+        else:
+            fragment_size = (self._connection_size - request_size - 4) // alignment * alignment  # -4 for the offset
+            data = memoryview(data)
+            for offset in range(0, len(data), fragment_size):
+                self._send_write(TAG_SERVICES_REQUEST['Write Tag Fragmented'], rp,
+                                 [data_type, pack_uint(elements), pack_dint(offset),
+                                  data[offset:offset + fragment_size]])
+        return True
+
+    def _send_write(self, service, rp, request_data):
+        message_request = [
+            pack_uint(self._get_sequence()),
+            bytes([service]),
+            bytes([len(rp) // 2]),
+            rp,
+            *request_data
+        ]
+        reply = self.send_unit_data(self.build_common_packet_format(DATA_ITEM['Connected'],
+                                                                    b''.join(message_request),
+                                                                    ADDRESS_ITEM['Connection Based'],
+                                                                    addr_data=self._target_cid))
+        if reply is None:
+            raise DataError("send_unit_data returned not valid data")
+
+    def _get_tag_udt(self, tag):
+        """
+        returns the udt definition for a structure tag or structure member, None if the tag is not a known structure
+        """
+        info = self._tags.lookup(tag)
+        if info is None or not isinstance(info[0], dict):
+            return None
+        return info[0]
+
     def write_array(self, tag, values, data_type, raw=False):
         """ write array of atomic data type from a connected plc
         At the moment there is not a strong validation for the argument passed. The user should verify
         the correctness of the format passed.
         :param tag: the name of the tag to read
         :param data_type: the type of tag to write
-        :param values: the array of values to write, if raw: the frame with bytes
+        :param values: the array of values to write (a list or `array.array`), if raw: the frame with bytes
         :param raw: indicates that the values are given as raw values (hex)
         """
         self.clear()
-        if not isinstance(values, list):
+        if not isinstance(values, (list, array)) and not (raw and isinstance(values, (bytes, bytearray))):
             self._status = (9, "A list of tags must be passed to write_array.")
             self.__log.warning(self._status)
             raise DataError(self._status[1])
@@ -565,92 +1120,198 @@ class LogixDriver(Base):
                 self.__log.warning(self._status)
                 raise DataError(self._status[1])
 
-        array_of_values = b''
-        byte_size = 0
-        byte_offset = 0
-
-        for i, value in enumerate(values):
-            array_of_values += value if raw else PACK_DATA_FUNCTION[data_type](value)
-            byte_size += DATA_FUNCTION_SIZE[data_type]
-
-            if byte_size >= 450 or i == len(values) - 1:
-                # create the message and send the fragment
-                rp = self.create_tag_rp(tag)
-                if rp is None:
-                    self._status = (9, f"Cannot create tag {tag} request packet write_array will not be executed.")
-                    return None
-                else:
-                    # Creating the Message Request Packet
-                    message_request = [
-                        pack_uint(self._get_sequence()),
-                        bytes([TAG_SERVICES_REQUEST["Write Tag Fragmented"]]),  # the Request Service
-                        bytes([len(rp) // 2]),  # the Request Path Size length in word
-                        rp,  # the request path
-                        pack_uint(DATA_TYPE[data_type]),  # Data type to write
-                        pack_uint(len(values)),  # Number of elements to write
-                        pack_dint(byte_offset),
-                        array_of_values  # Fragment of elements to write
-                    ]
-                    byte_offset += byte_size
-
-                msg = self.build_common_packet_format(
-                            DATA_ITEM['Connected'],
-                            b''.join(message_request),
-                            ADDRESS_ITEM['Connection Based'],
-                            addr_data=self._target_cid,
-                        )
+        try:
+            element_size = DATA_FUNCTION_SIZE[data_type]
+            if raw:
+                array_of_values = bytes(values) if isinstance(values, (bytes, bytearray)) else b''.join(values)
+            elif data_type in ARRAY_TYPECODE:
+                array_of_values = pack_array(values, data_type)
+            else:
+                array_of_values = b''.join(PACK_DATA_FUNCTION[data_type](value) for value in values)
+        except (LookupError, TypeError, OverflowError, struct.error) as err:
+            raise DataError(f'Unable to pack values for write_array: {err}')
 
-                reply = self.send_unit_data(msg)
-                if reply is None:
-                    raise DataError("send_unit_data returned not valid data")
+        rp = self.create_tag_rp(tag)
+        if rp is None:
+            self._status = (9, f"Cannot create tag {tag} request packet write_array will not be executed.")
+            return None
 
-                array_of_values = b''
-                byte_size = 0
-        return True
+        # fragments are sized to the connection, aligned to whole elements
+        return self._write_raw(rp, pack_uint(DATA_TYPE[data_type]), array_of_values,
+                               elements=len(array_of_values) // element_size, alignment=max(4, element_size))
 
     def write_string(self, tag, value, size=82):
         """
             Rockwell define different string size:
                 STRING  STRING_12   STRING_16   STRING_20   STRING_40   STRING_8
-            by default we assume size 82 (STRING)
+            by default we assume size 82 (STRING), `size` is only used if the string template is unknown
+            (the tag list has not been uploaded), otherwise the size is taken from the template
         """
-        data_tag = ".".join((tag, "DATA"))
-        len_tag = ".".join((tag, "LEN"))
+        result, = self._write_strings([(tag, value)], size)
+        return result
 
-        # create an empty array
-        data_to_send = [0] * size
-        for idx, val in enumerate(value):
-            try:
-                unsigned = ord(val)
-                data_to_send[idx] = unsigned - 256 if unsigned > 127 else unsigned
-            except IndexError:
-                break
+    def write_strings(self, values):
+        """
+        write multiple string tags, packing as many strings as will fit into each multi-request packet.
 
-        str_len = len(value)
-        if str_len > size:
-            str_len = size
+        If the tag list has been uploaded, each string is encoded into the image of its string type and written
+        in a single service.  Otherwise LEN and DATA are written as two services in the same packet, and strings are
+        truncated to the 82 characters of the STRING type.
 
-        result_len = self.write_tag(len_tag, str_len, 'DINT')
-        result_data = self.write_array(data_tag, data_to_send, 'SINT')
-        return result_data and result_len
+        :param values: dict of {tag name: string value}, or a list of (tag name, string value) tuples
+        :return: list of Tag results, one for each string in the same order, like `write_tag` with multiple tags
+        """
+        if isinstance(values, dict):
+            values = values.items()
+        return self._write_strings(values)
 
-    def read_string(self, tag, str_len=None):
-        data_tag = f'{tag}.DATA'
-        if str_len is None:
-            len_tag = f'{tag}.LEN'
-            tmp = self.read_tag(len_tag)
-            length, _ = tmp or (None, None)
+    def _write_strings(self, values, size=None):
+        self.clear()
+        if not self._target_is_connected:
+            if not self.forward_open():
+                self._status = (8, "Target did not connected. write_strings will not be executed.")
+                self.__log.warning(self._status)
+                raise DataError(self._status[1])
+
+        values = list(values)
+        self._prefetch_templates(tag for tag, _ in values)
+        rp_list, tags_added = [[]], [[]]
+        request_len = MULTISERVICE_REQUEST_HEADER
+        for index, (tag, value) in enumerate(values):
+            requests, typ = self._string_write_requests(tag, value, size)
+            tag_req_len = sum(len(request) + MULTISERVICE_WRITE_OVERHEAD for request in requests)
+            if tag_req_len + request_len >= self._connection_size and rp_list[-1]:
+                rp_list.append([])
+                tags_added.append([])
+                request_len = MULTISERVICE_REQUEST_HEADER
+            rp_list[-1] += requests
+            tags_added[-1] += [(index, (tag, value, typ))] * len(requests)
+            request_len += tag_req_len
+
+        results = [None] * len(values)
+        for req_list, tags_ in zip(rp_list, tags_added):
+            if not req_list:
+                continue
+            message_request = self.build_multiple_service(req_list, self._get_sequence())
+            reply = self.send_unit_data(self.build_common_packet_format(DATA_ITEM['Connected'],
+                                                                        b''.join(message_request),
+                                                                        ADDRESS_ITEM['Connection Based'],
+                                                                        addr_data=self._target_cid, ))
+            if reply is None:
+                raise DataError("send_unit_data returned not valid data")
+
+            # LEN and DATA are written by separate services, the string is only written if both succeed
+            indexes, tags_ = zip(*tags_)
+            for index, result in zip(indexes, self._parse_multiple_request_write(tags_, reply)):
+                previous = results[index]
+                if previous is None:
+                    results[index] = result
+                elif previous and not result:  # LEN was written, the old characters are left in DATA
+                    result.error = f'LEN was written but DATA failed: {result.error}'
+                    results[index] = result
+
+        return results
+
+    def _string_write_requests(self, tag, value, size=None):
+        """
+        :return: (list of the write requests for the string, data type name)
+        """
+        udt = self._get_tag_udt(tag)
+        layout = self._get_layout(udt['template_instance_id']) if udt is not None else None
+        if layout is not None and layout.string_size is not None:
+            rp = self.create_tag_rp(tag, multi_requests=True)
+            if rp is None:
+                self._status = (8, f"Cannot create tag {tag} request packet. write_strings will not be executed.")
+                raise DataError(self._status[1])
+
+            request = [bytes([TAG_SERVICES_REQUEST['Write Tag']]),
+                       rp,
+                       pack_uint(STRUCTURE_READ_REPLY),
+                       pack_uint(layout.handle),
+                       pack_uint(1),
+                       layout.encode(value)]
+            return [b''.join(request)], layout.name
+
+        try:
+            data = value.encode('iso-8859-1')
+        except (AttributeError, UnicodeError) as err:
+            raise DataError(f'Unable to encode string for {tag}: {err}')
+        if size is None:  # the size of the string type is unknown, don't write past the DATA of a STRING
+            data = data[:STRING_LAYOUT.string_size]
         else:
-            length = str_len
-
-        if length:
-            values = self.read_array(data_tag, length)
-            if values:
-                _, values = zip(*values)
-                chars = ''.join(chr(v + 256) if v < 0 else chr(v) for v in values)
-                string, *_ = chars.split('\x00', maxsplit=1)
-                return string
-        return None
+            data = data[:size]
+        length = len(data)
+        if size is not None:
+            data = data.ljust(size, b'\x00')
+
+        len_rp = self.create_tag_rp(f'{tag}.LEN', multi_requests=True)
+        data_rp = self.create_tag_rp(f'{tag}.DATA', multi_requests=True)
+        if len_rp is None or data_rp is None:
+            self._status = (8, f"Cannot create tag {tag} request packet. write_strings will not be executed.")
+            raise DataError(self._status[1])
+
+        requests = [b''.join([bytes([TAG_SERVICES_REQUEST['Write Tag']]), len_rp,
+                              pack_uint(DATA_TYPE['DINT']), pack_uint(1), pack_dint(length)])]
+        if data:
+            requests.append(b''.join([bytes([TAG_SERVICES_REQUEST['Write Tag']]), data_rp,
+                                      pack_uint(DATA_TYPE['SINT']), pack_uint(len(data)), data]))
+        return requests, 'STRING'
+
+    def read_string(self, tag, str_len=None):
+        """
+        read a STRING (or custom length string type) tag, the whole string structure is read in one request
+        and decoded using the LEN member
+
+        :param tag: the name of the string tag
+        :param str_len: optional, max number of characters to return
+        """
+        self.clear()
+        if not self._target_is_connected:
+            if not self.forward_open():
+                self._status = (7, "Target did not connected. read_string will not be executed.")
+                self.__log.warning(self._status)
+                raise DataError(self._status[1])
+
+        rp = self.create_tag_rp(tag)
+        if rp is None:
+            self._status = (7, f"Cannot create tag {tag} request packet. read_string will not be executed.")
+            return None
+
+        data_type, data = self._read_raw(rp)
+        if data_type != STRUCTURE_READ_REPLY:
+            raise DataError(f'{tag} is not a string')
+        string = self._decode_string(data)
+        return string if str_len is None else string[:str_len]
+
+    def read_strings(self, *tags):
+        """
+        read multiple string tags, packing as many strings as will fit into each multi-request packet
+
+        :return: list of Tag results, like `read_tag` with multiple tags
+        """
+        if len(tags) == 1 and isinstance(tags[0], (list, tuple)):
+            tags = tags[0]
+        self._prefetch_templates(tags)
+        sizes = {}
+        for tag in tags:
+            udt = self._get_tag_udt(tag)
+            sizes[tag] = udt['template']['structure_size'] if udt is not None else STRING_LAYOUT.size
+
+        self.clear()
+        if not self._target_is_connected:
+            if not self.forward_open():
+                self._status = (7, "Target did not connected. read_strings will not be executed.")
+                self.__log.warning(self._status)
+                raise DataError(self._status[1])
+
+        return self._read_tag_multi(tags, sizes, strings=True)
+
+    def _decode_string(self, data):
+        """ decode the string structure from the data of a read reply, starting with the structure handle """
+        layout = self._get_struct_layout(unpack_uint(data[:2]))
+        if layout is not None and layout.string_size is not None:
+            return layout.decode(data, 2)
+        return decode_string(data, 2)  # template not uploaded, LEN then DATA for the rest of the structure
 
     def get_plc_name(self):
         try:
@@ -761,7 +1422,7 @@ class LogixDriver(Base):
             'keyswitch': keyswitch
         }
 
-    def get_tag_list(self, program=None, cache=True):
+    def get_tag_list(self, program=None, cache=True, refresh=False):
         """
         Returns the list of tags from the controller. For only controller-scoped tags, get `program` to None (default).
         Set `program` to a program name to only get the program scoped tags from the specified program.
@@ -773,36 +1434,433 @@ class LogixDriver(Base):
         If the `cache` parameter is True (default), the list of tags will be stored so they can be referenced later.  This
         also allows the read/write methods to use the cached instance id's and allow packing more tags into a single
         request.
+
+        If the driver was created with a `tag_cache` directory, the tag list is loaded from the cache file for this
+        controller if it exists.  Set `refresh` to True to upload the tags and templates from the controller again
+        (and replace the cache file).
         """
+        if refresh:
+            self._clear_template_caches()
+        elif cache:
+            tags = self._load_shared_tag_list(program)
+            if tags is None and self._tag_cache is not None:
+                tags = self._load_tag_cache(program)
+            if tags is not None:
+                self._tag_list_scope = program
+                if not self.refresh_tag_list():
+                    self._share_tag_list()
+                return list(self._tags.values())
+
         if program == '*':
-            tags = self._get_tag_list()
-            for prog in self._program_names:
-                prog_tags = self._get_tag_list(prog)
-                for t in prog_tags:
-                    t['tag_name'] = f"{prog}.{t['tag_name']}"
+            tags = list(self._isolating_user_tag(self._get_instance_attribute_list_service()))
+            for prog_tags in self._get_program_tags(self._program_names):
                 tags += prog_tags
+            tags = self._resolve_templates(tags)  # templates used in many programs are only uploaded once
         else:
             tags = self._get_tag_list(program)
 
         if cache:
-            self._tags = {tag['tag_name']: tag for tag in tags}
+            self._tags = TagDatabase(((tag.tag_name, tag) for tag in tags), self._resolve_udt)
+            self._tag_list_scope = program
+            self._symbol_probes = {scope: self._get_symbol_class_attributes(scope)
+                                   for scope in self._tag_list_scopes(program)}
+            self._share_tag_list()
+            if self._tag_cache is not None:
+                self._save_tag_cache(program)
+
+        return tags
+
+    def _share_tag_list(self):
+        """ make the tag list available to the other drivers for this controller """
+        # copies, the TagDatabase references this driver and the TagInfo are updated when udts are resolved
+        tags = {name: tag.copy() for name, tag in dict.items(self._tags)}
+        with self._metadata.lock:
+            self._metadata.tag_list = (self._tag_list_scope, tags, dict(self._symbol_probes),
+                                       list(self._program_names))
+
+    def _load_shared_tag_list(self, program):
+        """
+        use the tag list uploaded by another driver for this controller
+
+        :return: the tag list, None if there isn't one for `program`
+        """
+        with self._metadata.lock:
+            shared = self._metadata.tag_list
+        if shared is None or shared[0] != program:
+            return None
+        _, tags, probes, programs = shared
+        self._tags = TagDatabase(((name, tag.copy()) for name, tag in tags.items()), self._resolve_udt)
+        self._symbol_probes = dict(probes)
+        self._program_names = list(programs)
+        return list(self._tags.values())
+
+    def refresh_tag_list(self):
+        """
+        Checks if tags have been added or deleted (e.g. by an online edit) since the tag list was uploaded and updates
+        the cached tag list if they have.  The check is a single request for each program scope, the max instance and
+        number of instances of the Symbol class are compared to when the tag list was uploaded.  If tags were only
+        added, only the new symbols are uploaded, else the symbol list for that scope is uploaded again.  Templates are
+        only uploaded for new structure types.
+
+        :return: True if the tag list changed
+        """
+        program = self._tag_list_scope
+        probes = {}
+        changed = False
+        scopes = self._tag_list_scopes(program, programs=False)
+        for scope in scopes:
+            probe = probes[scope] = self._get_symbol_class_attributes(scope)
+            known = self._symbol_probes.get(scope)
+            if probe != known:
+                changed = True
+                prefix = f'{scope}.' if program == '*' and scope is not None else ''
+                self._refresh_scope(program, scope, prefix, known, probe)
+            if program == '*' and scope is None:
+                scopes += self._program_names
+
+        if program == '*':  # drop the tags of deleted programs
+            self._tags = TagDatabase(((name, tag) for name, tag in self._tags.items()
+                                      if self._tag_scope(name, program) in probes), self._resolve_udt)
+
+        self._symbol_probes = probes
+        if changed:
+            self._share_tag_list()
+            if self._tag_cache is not None:
+                self._save_tag_cache(program)
+        return changed
+
+    def _refresh_scope(self, program, scope, prefix, known, probe):
+        if known is not None and probe[0] > known[0]:
+            all_tags = list(self._get_instance_attribute_list_service(scope, start_instance=known[0] + 1))
+            if known[1] + len(all_tags) == probe[1]:  # only new tags, no deleted tags
+                for tag in self._build_tag_list(all_tags, scope, prefix):
+                    self._tags[tag.tag_name] = tag
+                return
+
+        # tags were deleted, upload all the symbols in the scope again
+        if scope is None:
+            self._program_names = []
+            with self._metadata.lock:
+                self._instance_id_cache.clear()
+        self._tags = TagDatabase(((name, tag) for name, tag in self._tags.items()
+                                  if self._tag_scope(name, program) != scope), self._resolve_udt)
+        for tag in self._get_tag_list(scope, prefix):
+            self._tags[tag.tag_name] = tag
+
+    def _tag_list_scopes(self, program, programs=True):
+        """ the program scopes included in a tag list for `program`, None is the controller scope """
+        if program != '*':
+            return [program]
+        return [None] + self._program_names if programs else [None]
+
+    @staticmethod
+    def _tag_scope(name, program):
+        """ the program scope of a tag from a tag list for `program` """
+        if program != '*':
+            return program
+        return name.split('.')[0] if name.startswith('Program:') else None
+
+    def _get_symbol_class_attributes(self, program=None):
+        """
+        get the max instance and number of instances of the Symbol class, used to detect if tags have been
+        added or deleted
+
+        :return: (max instance, number of instances)
+        """
+        if not self._target_is_connected:
+            if not self.forward_open():
+                self._status = (10, "Target did not connected. refresh_tag_list will not be executed.")
+                self.__log.warning(self._status)
+                raise DataError(self._status[1])
+
+        path = self._program_path(program) + b''.join([
+            CLASS_ID["8-bit"],
+            CLASS_CODE["Symbol Object"],
+            INSTANCE_ID["16-bit"],
+            b'\x00',
+            pack_uint(0),  # class attributes
+        ])
+        message_request = [
+            pack_uint(self._get_sequence()),
+            bytes([TAG_SERVICES_REQUEST['Get Attributes']]),
+            pack_usint(len(path) // 2),
+            path,
+            b'\x02\x00',  # Number of attributes to retrieve
+            b'\x02\x00',  # Attribute 2: Max Instance
+            b'\x03\x00',  # Attribute 3: Number of Instances
+        ]
+        reply = self.send_unit_data(self.build_common_packet_format(DATA_ITEM['Connected'],
+                                                                    b''.join(message_request),
+                                                                    ADDRESS_ITEM['Connection Based'],
+                                                                    addr_data=self._target_cid, ))
+        if reply is None:
+            raise DataError("send_unit_data returned not valid data")
 
+        data = reply[REPLY_START:]
+        # each attribute is (id, status, value), the values are both UINT or both UDINT depending on the controller
+        size = (len(data) - 2) // 2 - 4
+        unpack = unpack_udint if size == 4 else unpack_uint
+        return unpack(data[6:6 + size]), unpack(data[10 + size:10 + 2 * size])
+
+    @staticmethod
+    def _program_path(program):
+        """ the symbolic segment for a program scope, empty for the controller scope """
+        if program is None:
+            return b''
+        if not program.startswith('Program:'):
+            program = f'Program:{program}'
+        path = [EXTENDED_SYMBOL, pack_usint(len(program)), program.encode('utf-8')]
+        if len(program) % 2:
+            path.append(b'\x00')
+        return b''.join(path)
+
+    def save_tag_snapshot(self, path):
+        """
+        Saves the tag list and structure templates from `get_tag_list` to a binary snapshot file.  Other processes
+        (e.g. the workers of a pre-fork server) can then load the tag list with `load_tag_snapshot` instead of each
+        uploading it from the controller.  Unlike the `tag_cache` files, snapshots are safe to load from anywhere.
+
+        :param path: the snapshot file, replaced if it exists
+        """
+        program = self._tag_list_scope
+        scopes = self._tag_list_scopes(program)
+        programs = {_program_scope(scope) for scope in scopes}
+        scopes += [prog for prog in self._program_names if _program_scope(prog) not in programs]
+        scope_index = {scope: i for i, scope in enumerate(scopes)}
+        symbols = []
+        for name, tag in self._tags.items():
+            scope = self._tag_scope(name, program)
+            if program == '*' and scope is not None:
+                name = name[len(scope) + 1:]
+            symbols.append((scope_index[scope], tag['instance_id'], name, self._symbol_type(tag)))
+        symbols.sort(key=itemgetter(0))
+
+        with self._metadata.lock:
+            templates = [(instance_id, self._struct_cache[instance_id], body)
+                         for instance_id, body in self._template_cache.items() if instance_id in self._struct_cache]
+        write_snapshot(path, self._info, program, [(scope, self._symbol_probes.get(scope)) for scope in scopes],
+                       symbols, templates)
+
+    def load_tag_snapshot(self, path):
+        """
+        Loads the tag list and structure templates from a snapshot file created by `save_tag_snapshot`, replacing
+        the current tag list.  Nothing is requested from the controller, use `refresh_tag_list` to check if the
+        snapshot is still current.  If the controller info is known, the snapshot must be for the same controller.
+
+        :return: the tag list
+        """
+        with TagSnapshot(path) as snapshot:
+            for key, value in snapshot.info.items():
+                if value and self._info.get(key) and str(self._info[key]) != value:
+                    raise DataError(f'Tag snapshot {path} is for a different controller ({key}: {value})')
+
+            self._clear_template_caches()
+            with self._metadata.lock:
+                for instance_id, makeup, body in snapshot.templates():
+                    self._struct_cache[instance_id] = makeup
+                    self._template_cache[instance_id] = body
+                self._instance_id_cache.clear()
+
+            program = snapshot.tag_list_scope
+            scopes = [scope for scope, _ in snapshot.scopes]
+            tags = []
+            for index, symbols in groupby(snapshot.symbols(), itemgetter(0)):
+                scope = scopes[index]
+                prefix = f'{scope}.' if program == '*' and scope is not None else ''
+                tags += self._isolating_user_tag((symbol[1:] for symbol in symbols), scope, prefix)
+
+            # program names are always collected as 'Program:<name>', a program scoped tag list may not have the prefix
+            self._program_names = list(dict.fromkeys(_program_scope(scope) for scope in scopes if scope is not None))
+            self._symbol_probes = {scope: probe for scope, probe in snapshot.scopes if probe is not None}
+
+        tags = self._resolve_templates(tags)
+        self._tags = TagDatabase(((tag.tag_name, tag) for tag in tags), self._resolve_udt)
+        self._tag_list_scope = program
+        self._share_tag_list()
         return tags
 
-    def _get_tag_list(self, program=None):
-        all_tags = self._get_instance_attribute_list_service(program)
-        user_tags = self._isolating_user_tag(all_tags)
+    @staticmethod
+    def _symbol_type(tag):
+        """ the symbol type attribute of a tag from the tag list """
+        symbol_type = tag['dim'] << 13
+        if tag['tag_type'] == 'struct':
+            return symbol_type | 0b1000000000000000 | tag['template_instance_id']
+        symbol_type |= DATA_TYPE[tag['data_type']]
+        if tag['bit_position'] is not None:
+            symbol_type |= tag['bit_position'] << 8
+        return symbol_type
+
+    def _clear_template_caches(self):
+        """
+        start again with empty template caches, new ones replace the shared caches for the drivers attached from now
+        on, the drivers already attached keep the caches their tag lists were resolved with
+        """
+        attached = self._metadata_release is not None
+        self._detach_metadata()
+        metadata = ControllerMetadata()
+        with self._metadata.lock:
+            metadata.instance_ids.update(self._instance_id_cache)
+        self._use_metadata(metadata)
+        if attached:
+            self._attach_metadata(replace=True)
+
+    def _tag_cache_file(self, program=None):
+        """ the cache file for this controller and program scope, identified by the serial, revision and name """
+        if not self._info.get('serial'):
+            self.get_plc_info()
+        if not self._info.get('name'):
+            self.get_plc_name()
+        key = f"{self._info['serial']}_{self._info['revision']}_{self._info['name']}"
+        if program is not None:
+            key += f'_{program}'
+        return os.path.join(self._tag_cache, re.sub(r'[^\w.-]', '_', key) + '.pycomm3')
+
+    def _save_tag_cache(self, program=None):
+        path = self._tag_cache_file(program)
+        with self._metadata.lock:  # copies, the caches may be changed by other drivers while pickling
+            cache = {
+                'version': TAG_CACHE_VERSION,
+                'tags': self._tags,
+                'instance_ids': dict(self._instance_id_cache),
+                'structs': dict(self._struct_cache),
+                'templates': dict(self._template_cache),
+                'udts': dict(self._udt_cache),
+                'programs': self._program_names,
+                'probes': self._symbol_probes,
+            }
+        try:
+            os.makedirs(self._tag_cache, exist_ok=True)
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                pickle.dump(cache, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except (OSError, pickle.PicklingError) as err:
+            self.__log.warning(f'Failed to save the tag cache {path}: {err}')
+
+    def _load_tag_cache(self, program=None):
+        """
+        load the tag list and templates from the cache file
+
+        :return: the tag list, None if there is no valid cache for this controller
+        """
+        path = self._tag_cache_file(program)
+        try:
+            with open(path, 'rb') as f:
+                cache = pickle.load(f)
+            if cache.get('version') != TAG_CACHE_VERSION:
+                return None
+            self._tags = TagDatabase(cache['tags'], self._resolve_udt)
+            with self._metadata.lock:
+                self._instance_id_cache.update(cache['instance_ids'])
+                self._struct_cache.update(cache['structs'])
+                self._template_cache.update(cache['templates'])
+                self._udt_cache.update(cache['udts'])
+                self._struct_handles.update((udt['template']['structure_handle'], instance_id)
+                                            for instance_id, udt in cache['udts'].items())
+            self._program_names = cache['programs']
+            self._symbol_probes = cache['probes']
+        except FileNotFoundError:
+            return None
+        except Exception as err:
+            self.__log.warning(f'Failed to load the tag cache {path}: {err}')
+            return None
+
+        self.__log.info(f'Loaded tag list from cache {path}')
+        return list(self._tags.values())
+
+    def _get_tag_list(self, program=None, prefix=''):
+        return self._build_tag_list(self._get_instance_attribute_list_service(program), program, prefix)
+
+    def _build_tag_list(self, all_tags, program=None, prefix=''):
+        return self._resolve_templates(list(self._isolating_user_tag(all_tags, program, prefix)))
+
+    def _get_program_tags(self, programs):
+        """
+        uploads the tags of the programs, spread over up to `upload_connections` connections, the templates
+        of struct tags are not uploaded
+
+        :return: generator of the list of TagInfo for each program, in the same order as `programs`
+        """
+        if min(self.upload_connections, len(programs)) <= 1:
+            for prog in programs:
+                yield list(self._isolating_user_tag(self._get_instance_attribute_list_service(prog), prog, f'{prog}.'))
+            return
+
+        drivers = Queue()
+        drivers.put(self)
+        workers = [self._upload_worker() for _ in range(min(self.upload_connections, len(programs)) - 1)]
+        workers = [worker for worker in workers if worker is not None]
+        for worker in workers:
+            drivers.put(worker)
+
+        def upload(prog):
+            driver = drivers.get()
+            try:
+                symbols = driver._get_instance_attribute_list_service(prog)
+                return list(self._isolating_user_tag(symbols, prog, f'{prog}.'))
+            finally:
+                drivers.put(driver)
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(workers) + 1) as executor:
+                yield from executor.map(upload, programs)
+        finally:
+            for worker in workers:
+                try:
+                    worker.close()
+                except CommError as err:
+                    self.__log.warning(f'Error closing upload connection: {err}')
+
+    def _upload_worker(self):
+        """
+        opens another connection to the controller for uploading program symbols, None if it could not be opened
+        """
+        args, kwargs = self._init_args
+        worker = LogixDriver(self.attribs['ip address'], *args, slot=self.attribs['cpu slot'],
+                             large_packets=self.attribs['extended forward open'], init_info=False, init_tags=False,
+                             shared_metadata=False, **kwargs)
+        for attr in ('port', 'timeout', 'backplane', 'rpi'):
+            worker.attribs[attr] = self.attribs[attr]
+        try:
+            if worker.open() and worker.forward_open():
+                return worker
+            self.__log.warning(f'Failed to open upload connection: {worker.status}')
+        except (CommError, DataError) as err:
+            self.__log.warning(f'Failed to open upload connection: {err}')
+        try:
+            worker.close()
+        except CommError:
+            pass
+        return None
+
+    def _resolve_templates(self, user_tags):
+        """ uploads the templates used by the tags and sets their udt definitions, unless `lazy_udts` is set """
+        if self.lazy_udts:
+            return user_tags
+
+        self._upload_templates({tag.template_instance_id for tag in user_tags if tag.tag_type == 'struct'})
         for tag in user_tags:
-            if tag['tag_type'] == 'struct':
-                tag['template'] = self._get_structure_makeup(tag['template_instance_id'])
-                tag['udt'] = self._parse_udt_raw(tag)
+            if tag.tag_type == 'struct':
+                try:
+                    self._resolve_udt(tag)
+                except DataError as err:  # left unresolved, it's retried when the tag is used
+                    self.__log.warning(f'Failed to get the udt of {tag.tag_name}: {err}')
         return user_tags
 
-    def _get_instance_attribute_list_service(self, program=None):
+    def _resolve_udt(self, tag):
+        """ set the structure makeup and udt definition of a struct tag, uploading the template if needed """
+        tag.template = self._get_structure_makeup(tag.template_instance_id)
+        tag.udt = self._parse_udt_raw(tag)
+
+    def _get_instance_attribute_list_service(self, program=None, start_instance=0):
         """ Step 1: Finding user-created controller scope tags in a Logix5000 controller
 
         This service returns instance IDs for each created instance of the symbol class, along with a list
         of the attribute data associated with the requested attribute
+
+        :param start_instance: the first instance to return, to only get the symbols created after a known instance
+        :return: generator of (instance id, symbol name (bytes), symbol type) for each symbol, the symbols in a reply
+                 are parsed before the next request is sent
         """
         try:
             if not self._target_is_connected:
@@ -811,17 +1869,10 @@ class LogixDriver(Base):
                     self.__log.warning(self._status)
                     raise DataError(self._status[1])
 
-            last_instance = 0
-            tag_list = []
+            last_instance = start_instance
             while last_instance != -1:
                 # Creating the Message Request Packet
-                path = []
-                if program is not None and not program.startswith('Program:'):
-                    program = f'Program:{program}'
-                if program:
-                    path = [EXTENDED_SYMBOL, pack_usint(len(program)), program.encode('utf-8')]
-                    if len(program) % 2:
-                        path.append(b'\x00')
+                path = [self._program_path(program)]
                 path += [
                     # Request Path ( 20 6B 25 00 Instance )
                     CLASS_ID["8-bit"],  # Class id = 20 from spec 0x20
@@ -854,86 +1905,67 @@ class LogixDriver(Base):
                 if reply is None:
                     raise DataError("send_unit_data returned not valid data")
 
-                last_instance = self._parse_instance_attribute_list(reply, tag_list)
-            return tag_list
-
-        except Exception as e:
-            raise DataError(e)
+                instance = None
+                for symbol in _instance_attribute_list(reply):
+                    instance = symbol[0]
+                    yield symbol
 
-    def _parse_instance_attribute_list(self, reply, tag_list):
-        """ extract the tags list from the message received"""
+                status = _unit_data_status(reply)
+                if status == INSUFFICIENT_PACKETS and instance is not None:
+                    last_instance = instance + 1
+                else:
+                    if status != SUCCESS:
+                        self._status = (1, 'unknown status during _get_instance_attribute_list_service')
+                    last_instance = -1
 
-        status = _unit_data_status(reply)
-        tags_returned = reply[REPLY_START:]
-        tags_returned_length = len(tags_returned)
-        idx = count = instance = 0
-        try:
-            while idx < tags_returned_length:
-                instance = unpack_dint(tags_returned[idx:idx + 4])
-                idx += 4
-                tag_length = unpack_uint(tags_returned[idx:idx + 2])
-                idx += 2
-                tag_name = tags_returned[idx:idx + tag_length]
-                idx += tag_length
-                symbol_type = unpack_uint(tags_returned[idx:idx + 2])
-                idx += 2
-                count += 1
-                tag_list.append({'instance_id': instance,
-                                 'tag_name': tag_name,
-                                 'symbol_type': symbol_type})
         except Exception as e:
             raise DataError(e)
 
-        if status == SUCCESS:
-            last_instance = -1
-        elif status == INSUFFICIENT_PACKETS:
-            last_instance = instance + 1
-        else:
-            self._status = (1, 'unknown status during _parse_instance_attribute_list')
-            last_instance = -1
+    def _isolating_user_tag(self, all_tags, program=None, prefix=''):
+        """
+        creates the TagInfo for the user tags in the symbols from `_get_instance_attribute_list_service`,
+        `program` is the program the symbols are from, None for controller scoped symbols.  Program names are
+        collected, system and hidden symbols are skipped without decoding their names.
 
-        return last_instance
+        :param prefix: added to the tag names, e.g. 'Program:MainProgram.' for a tag list of all programs
 
-    def _isolating_user_tag(self, all_tags):
+        :return: generator of TagInfo
+        """
+        instance_ids = {}
         try:
-            user_tags = []
-            for tag in all_tags:
-                name = tag['tag_name'].decode()
-                if 'Program:' in name:
-                    self._program_names.append(name)
+            for instance_id, name, symbol_type in all_tags:
+                if b'Program:' in name:
+                    name = name.decode()
+                    if name not in self._program_names:
+                        self._program_names.append(name)
                     continue
-                if ':' in name or '__' in name:
+                if b':' in name or b'__' in name:
                     continue
-                if tag['symbol_type'] & 0b0001000000000000:
+                if symbol_type & 0b0001000000000000:
                     continue
 
-                self._instance_id_cache[name] = tag['instance_id']
-
-                new_tag = {
-                    'tag_name': name,
-                    'dim': (tag['symbol_type'] & 0b0110000000000000) >> 13,  # bit 13 & 14, number of array dims
-                    'instance_id': tag['instance_id']
-                }
-
-                if tag['symbol_type'] & 0b1000000000000000:  # bit 15, 1 = struct, 0 = atomic
-                    template_instance_id = tag['symbol_type'] & 0b0000111111111111
-                    new_tag['tag_type'] = 'struct'
-                    new_tag['data_type'] = 'user-created'
-                    new_tag['template_instance_id'] = template_instance_id
-                    new_tag['template'] = {}
-                    new_tag['udt'] = {}
+                name = name.decode()
+                if program is None:  # the ids of program tags are not used, they'd replace the controller tags
+                    instance_ids[name] = instance_id
+                name = prefix + name
+
+                dim = (symbol_type & 0b0110000000000000) >> 13  # bit 13 & 14, number of array dims
+                if symbol_type & 0b1000000000000000:  # bit 15, 1 = struct, 0 = atomic
+                    template_instance_id = symbol_type & 0b0000111111111111
+                    # template and udt are set by _resolve_udt, references to the definitions in the template caches
+                    yield TagInfo(name, instance_id, 'struct', 'user-created', dim,
+                                  template_instance_id=template_instance_id, dimensions=None if dim else ())
                 else:
-                    new_tag['tag_type'] = 'atomic'
-                    datatype = tag['symbol_type'] & 0b0000000011111111
-                    new_tag['data_type'] = DATA_TYPE[datatype]
+                    datatype = symbol_type & 0b0000000011111111
+                    bit_position = None
                     if datatype == DATA_TYPE['BOOL']:
-                        new_tag['bit_position'] = (tag['symbol_type'] & 0b0000011100000000) >> 8
-
-                user_tags.append(new_tag)
-
-            return user_tags
+                        bit_position = (symbol_type & 0b0000011100000000) >> 8
+                    yield TagInfo(name, instance_id, 'atomic', DATA_TYPE[datatype], dim, bit_position,
+                                  dimensions=None if dim else ())
         except Exception as e:
             raise DataError(e)
+        with self._metadata.lock:
+            self._instance_id_cache.update(instance_ids)
 
     def _get_structure_makeup(self, instance_id):
         """
@@ -948,18 +1980,7 @@ class LogixDriver(Base):
 
             message_request = [
                 pack_uint(self._get_sequence()),
-                bytes([TAG_SERVICES_REQUEST['Get Attributes']]),
-                b'\x03',  # Request Path ( 20 6B 25 00 Instance )
-                CLASS_ID["8-bit"],  # Class id = 20 from spec 0x20
-                CLASS_CODE["Template Object"],  # Logical segment: Template Object 0x6C
-                INSTANCE_ID["16-bit"],  # Instance Segment: 16 Bit instance 0x25
-                b'\x00',
-                pack_uint(instance_id),
-                b'\x04\x00',  # Number of attributes
-                b'\x04\x00',  # Template Object Definition Size UDINT
-                b'\x05\x00',  # Template Structure Size UDINT
-                b'\x02\x00',  # Template Member Count UINT
-                b'\x01\x00'  # Structure Handle We can use this to read and write UINT
+                self._structure_makeup_request(instance_id)
             ]
 
             reply = self.send_unit_data(self.build_common_packet_format(DATA_ITEM['Connected'],
@@ -969,20 +1990,54 @@ class LogixDriver(Base):
             if reply is None:
                 raise DataError("send_unit_data returned not valid data")
 
-            self._struct_cache[instance_id] = self._parse_structure_makeup_attributes(reply)
+            return self._cache(self._struct_cache, instance_id, self._parse_structure_makeup_attributes(reply))
 
         return self._struct_cache[instance_id]
 
+    @staticmethod
+    def _structure_makeup_request(instance_id):
+        return b''.join([
+            bytes([TAG_SERVICES_REQUEST['Get Attributes']]),
+            b'\x03',  # Request Path ( 20 6B 25 00 Instance )
+            CLASS_ID["8-bit"],  # Class id = 20 from spec 0x20
+            CLASS_CODE["Template Object"],  # Logical segment: Template Object 0x6C
+            INSTANCE_ID["16-bit"],  # Instance Segment: 16 Bit instance 0x25
+            b'\x00',
+            pack_uint(instance_id),
+            b'\x04\x00',  # Number of attributes
+            b'\x04\x00',  # Template Object Definition Size UDINT
+            b'\x05\x00',  # Template Structure Size UDINT
+            b'\x02\x00',  # Template Member Count UINT
+            b'\x01\x00'  # Structure Handle We can use this to read and write UINT
+        ])
+
+    @staticmethod
+    def _template_request(instance_id, offset, size):
+        return b''.join([
+            bytes([TAG_SERVICES_REQUEST['Read Template']]),
+            b'\x03',  # Request Path ( 20 6B 25 00 Instance )
+            CLASS_ID["8-bit"],  # Class id = 20 from spec 0x20
+            CLASS_CODE["Template Object"],  # Logical segment: Template Object 0x6C
+            INSTANCE_ID["16-bit"],  # Instance Segment: 16 Bit instance 0x25
+            b'\x00',
+            pack_uint(instance_id),
+            pack_dint(offset),  # Offset
+            pack_uint(size)
+        ])
+
     @staticmethod
     def _parse_structure_makeup_attributes(reply):
         """ extract the tags list from the message received"""
+        return LogixDriver._parse_structure_makeup(_unit_data_status(reply), reply[REPLY_START:])
+
+    @staticmethod
+    def _parse_structure_makeup(status, attribute):
+        """ extract the structure attributes from the reply data of the Get Attributes service """
         structure = {}
-        status = _unit_data_status(reply)
         if status != SUCCESS:
             structure['Error'] = status
-            return
+            return structure
 
-        attribute = reply[REPLY_START:]
         idx = 4
         try:
             if unpack_uint(attribute[idx:idx + 2]) == SUCCESS:
@@ -1021,32 +2076,22 @@ class LogixDriver(Base):
         except Exception as e:
             raise DataError(e)
 
-    def _read_template(self, instance_id, object_definition_size):
+    def _read_template(self, instance_id, object_definition_size, offset=0, template=b''):
         """ get a list of the tags in the plc
 
+        :param offset: offset to start reading from, with `template` the part of the template already read
         """
-        if not self._target_is_connected:
-            if not self.forward_open():
-                self._status = (10, "Target did not connected. get_tag_list will not be executed.")
-                self.__log.warning(self._status)
-                raise DataError(self._status[1])
-
         if instance_id not in self._template_cache:
-            offset = 0
-            template = b''
+            if not self._target_is_connected:
+                if not self.forward_open():
+                    self._status = (10, "Target did not connected. get_tag_list will not be executed.")
+                    self.__log.warning(self._status)
+                    raise DataError(self._status[1])
             try:
                 while offset is not None:
                     message_request = [
                         pack_uint(self._get_sequence()),
-                        bytes([TAG_SERVICES_REQUEST['Read Template']]),
-                        b'\x03',  # Request Path ( 20 6B 25 00 Instance )
-                        CLASS_ID["8-bit"],  # Class id = 20 from spec 0x20
-                        CLASS_CODE["Template Object"],  # Logical segment: Template Object 0x6C
-                        INSTANCE_ID["16-bit"],  # Instance Segment: 16 Bit instance 0x25
-                        b'\x00',
-                        pack_uint(instance_id),
-                        pack_dint(offset),  # Offset
-                        pack_uint(((object_definition_size * 4) - 21) - offset)
+                        self._template_request(instance_id, offset, ((object_definition_size * 4) - 21) - offset)
                     ]
 
                     reply = self.send_unit_data(self.build_common_packet_format(DATA_ITEM['Connected'],
@@ -1058,7 +2103,7 @@ class LogixDriver(Base):
 
                     offset, template = self._parse_template(reply, offset, template)
 
-                self._template_cache[instance_id] = template
+                return self._cache(self._template_cache, instance_id, template)
 
             except Exception as e:
                 raise DataError(e)
@@ -1076,64 +2121,320 @@ class LogixDriver(Base):
             offset = None
         elif status == INSUFFICIENT_PACKETS:
             offset += bytes_received
-        else:
+        else:  # don't keep a partial template
             self._status = (1, f'unknown status {status} during _parse_template')
             self.__log.warning(self._status)
-            offset = None
+            raise DataError(self._status[1])
 
         return offset, template
 
-    def _build_udt(self, data, member_count):
-        udt = {'name': None, 'internal_tags': [], 'data_type': []}
-        names = (x.decode(errors='replace') for x in data.split(b'\x00') if len(x) > 1)
-        for name in names:
-            if ';' in name and udt['name'] is None:
-                udt['name'] = name[:name.find(';')]
-            elif 'ZZZZZZZZZZ' in name:
-                continue
-            elif name.isalnum():
-                udt['internal_tags'].append(name)
-            else:
+    def _upload_templates(self, instance_ids):
+        """
+        Uploads the templates for `instance_ids` and all the templates nested in them, breadth-first.  At each level
+        the structure makeup (Get Attributes) of all the unknown templates is requested in multi-service packets,
+        then the template bodies that fit in a single reply are read in multi-service packets too.  Only larger
+        templates are read one at a time (using multiple Read Template requests).  The results are stored in
+        `_struct_cache` and `_template_cache`, the udts are built from those by `_get_udt`.
+        """
+        # requests are sent without holding the metadata lock, if another driver for the controller uploads the same
+        # templates at the same time the results cached first are kept
+        pending = [i for i in set(instance_ids) if i not in self._udt_cache and i not in self._template_cache]
+        if pending and not self._target_is_connected:
+            if not self.forward_open():
+                self._status = (10, "Target did not connected. get_tag_list will not be executed.")
+                self.__log.warning(self._status)
+                raise DataError(self._status[1])
+
+        while pending:
+            structs = {i: self._struct_cache.get(i) for i in pending}
+            makeup_ids = [i for i, struct in structs.items() if struct is None]
+            requests = [self._structure_makeup_request(i) for i in makeup_ids]
+            for ids, replies in self._send_multiple_service(requests, makeup_ids, TEMPLATE_ATTRIBUTES_REPLY_SIZE):
+                for instance_id, (status, data) in zip(ids, replies):
+                    structs[instance_id] = self._cache(self._struct_cache, instance_id,
+                                                       self._parse_structure_makeup(status, data))
+
+            templates = {i: struct for i, struct in structs.items()
+                         if i not in self._template_cache and not struct.get('Error')}
+            sizes = {i: (t['object_definition_size'] * 4) - 21 for i, t in templates.items()}
+            batched = [i for i in templates if sizes[i] + MULTISERVICE_READ_REPLY_OVERHEAD * 2 < self._connection_size]
+            requests = [self._template_request(i, 0, sizes[i]) for i in batched]
+            bodies = {}
+            for ids, replies in self._send_multiple_service(requests, batched, lambda i: sizes[i]):
+                for instance_id, (status, data) in zip(ids, replies):
+                    if status == SUCCESS:
+                        bodies[instance_id] = self._cache(self._template_cache, instance_id, bytes(data))
+                    elif status == INSUFFICIENT_PACKETS:  # read the rest separately
+                        bodies[instance_id] = self._upload_template(instance_id, templates[instance_id],
+                                                                    len(data), bytes(data))
+                    else:
+                        self.__log.warning(f'Failed to read template {instance_id}, status: {status}')
+            for instance_id in templates:
+                if instance_id not in batched:
+                    bodies[instance_id] = self._upload_template(instance_id, templates[instance_id])
+
+            nested = set()
+            for instance_id, body in bodies.items():
+                if body is not None:
+                    nested.update(self._nested_templates(body, templates[instance_id]['member_count']))
+            pending = [i for i in nested if i not in self._udt_cache and i not in self._template_cache]
+
+    def _upload_template(self, instance_id, template, offset=0, data=b''):
+        """
+        read a template too large for a multi-service packet, a failure is only logged so the other templates are
+        still uploaded, the error is raised when the udt is used
+
+        :return: the template, None if it failed
+        """
+        try:
+            return self._read_template(instance_id, template['object_definition_size'], offset, data)
+        except DataError as err:
+            self.__log.warning(f'Failed to read template {instance_id}: {err}')
+            return None
+
+    @staticmethod
+    def _nested_templates(data, member_count):
+        """ the instance ids of the templates of the structure members in the template `data` """
+        return {type_code & 0b0000111111111111
+                for _, type_code, _ in _MEMBER_DEFINITION.iter_unpack(memoryview(data)[:member_count * 8])
+                if type_code not in DATA_TYPE and (type_code & 0b0000111111111111) not in DATA_TYPE}
+
+    def _send_multiple_service(self, requests, keys, reply_size):
+        """
+        send `requests` in as few multi-service packets as the connection size allows
+
+        :param keys: a key for each request, returned with the replies
+        :param reply_size: the max size of the reply to each request, or callable(key) returning it
+        :return: generator of (keys, replies) for each packet sent, a reply is (general status, reply data)
+        """
+        packets = [[]]
+        request_len = MULTISERVICE_REQUEST_HEADER
+        reply_len = MULTISERVICE_READ_REPLY_OVERHEAD
+        for request, key in zip(requests, keys):
+            size = (reply_size(key) if callable(reply_size) else reply_size) + MULTISERVICE_READ_REPLY_OVERHEAD
+            if (request_len + len(request) + MULTISERVICE_READ_OVERHEAD >= self._connection_size or
+                    reply_len + size >= self._connection_size) and packets[-1]:
+                packets.append([])
+                request_len = MULTISERVICE_REQUEST_HEADER
+                reply_len = MULTISERVICE_READ_REPLY_OVERHEAD
+            packets[-1].append((request, key))
+            request_len += len(request) + MULTISERVICE_READ_OVERHEAD
+            reply_len += size
+
+        for packet in packets:
+            if not packet:
                 continue
-        if udt['name'] is None:
-            udt['name'] = 'Not a user define structure'
+            message_request = self.build_multiple_service([request for request, _ in packet], self._get_sequence())
+            reply = self.send_unit_data(self.build_common_packet_format(DATA_ITEM['Connected'],
+                                                                        b''.join(message_request),
+                                                                        ADDRESS_ITEM['Connection Based'],
+                                                                        addr_data=self._target_cid, ))
+            if reply is None:
+                raise DataError("send_unit_data returned not valid data")
+            yield [key for _, key in packet], _multiple_service_replies(reply)
 
-        for _ in range(member_count):
-            array_size = unpack_uint(data[:2])
-            try:
-                data_type = DATA_TYPE[unpack_uint(data[2:4])]
-            except Exception:
-                dtval = unpack_uint(data[2:4])
-                instance_id = dtval & 0b0000111111111111
+    def _build_udt(self, data, member_count):
+        """
+        build the udt definition from the template `data`, the templates of nested structures are expected to have
+        been uploaded already by `_upload_templates`
+        """
+        template_name, members = _template_members(data, member_count)
+        udt = {'name': template_name.partition(';')[0] or 'Not a user define structure',
+               'internal_tags': [name for name, *_ in members if not is_hidden_member(name)],
+               'data_type': [],
+               'members': []}
+
+        for name, info, type_code, offset in members:
+            if type_code in DATA_TYPE:
+                data_type = DATA_TYPE[type_code]
+            else:
+                instance_id = type_code & 0b0000111111111111
                 if instance_id in DATA_TYPE:
                     data_type = DATA_TYPE[instance_id]
                 else:
                     try:
-                        template = self._get_structure_makeup(instance_id)
-                        if not template.get('Error'):
-                            _data = self._read_template(instance_id, template['object_definition_size'])
-                            data_type = self._build_udt(_data, template['member_count'])
-                        else:
-                            data_type = 'None'
+                        data_type = self._get_udt(instance_id)
                     except Exception:
                         data_type = 'None'
 
-            offset = unpack_dint(data[4:8])
-            udt['data_type'].append((array_size, data_type, offset))
+            udt['data_type'].append((info, data_type, offset))
+            udt['members'].append({
+                'name': name,
+                'data_type': data_type,
+                'offset': offset,
+                'array': info if data_type != 'BOOL' else 0,  # number of elements, 0 if not an array
+                'bit': info if data_type == 'BOOL' else None  # BOOL members are a bit of a hidden SINT
+            })
 
-            data = data[8:]
         return udt
 
+    def _get_udt(self, instance_id):
+        """
+        returns the udt definition for the template, uploading the template if it has not been cached
+        """
+        if instance_id not in self._udt_cache:
+            self._upload_templates([instance_id])  # also uploads any nested templates
+            template = self._get_structure_makeup(instance_id)
+            if template.get('Error'):
+                raise DataError(f'Failed to get the structure makeup of template {instance_id}: {template["Error"]}')
+            buff = self._read_template(instance_id, template['object_definition_size'])
+            udt = self._build_udt(buff, template['member_count'])
+            udt['template_instance_id'] = instance_id
+            udt['template'] = template
+            with self._metadata.lock:
+                udt = self._udt_cache.setdefault(instance_id, udt)
+                self._struct_handles[template['structure_handle']] = instance_id
+            return udt
+
+        return self._udt_cache[instance_id]
+
     def _parse_udt_raw(self, tag):
-        if tag['template_instance_id'] not in self._udt_cache:
-            try:
-                buff = self._read_template(tag['template_instance_id'], tag['template']['object_definition_size'])
-                member_count = tag['template']['member_count']
-                self._udt_cache[tag['template_instance_id']] = self._build_udt(buff, member_count)
-            except Exception as e:
-                raise DataError(e)
+        try:
+            return self._get_udt(tag['template_instance_id'])
+        except Exception as e:
+            raise DataError(e)
+
+    def _get_layout(self, instance_id):
+        """
+        returns the compiled layout for the template, compiling it the first time it's used
+        """
+        layout = self._layout_cache.get(instance_id)
+        if layout is None:
+            udt = self._get_udt(instance_id)
+            with self._metadata.lock:  # nested layouts are added to the cache while compiling
+                layout = self._layout_cache.get(instance_id)
+                if layout is None:
+                    layout = self._layout_cache[instance_id] = StructLayout(udt, self._layout_cache)
+        return layout
+
+    def _get_struct_layout(self, structure_handle):
+        """
+        returns the compiled layout for the structure handle returned in a read reply,
+        None if the template for that handle has not been uploaded
+        """
+        try:
+            instance_id = self._struct_handles[structure_handle]
+        except KeyError:  # the udts are indexed by `_get_udt`, unknown handles are cached as None until then
+            instance_id = self._cache(self._struct_handles, structure_handle, None)
+        if instance_id is None:
+            return STRING_LAYOUT if structure_handle == STRING_LAYOUT.handle else None
+        return self._get_layout(instance_id)
+
+    def _tag_struct_layout(self, structure_handle, tag=None):
+        """
+        returns the compiled layout for the structure handle returned when reading `tag`, if the handle is unknown
+        but the udt of `tag` is known (e.g. it was resolved before the template caches were replaced) the udt is
+        cached again for that handle.  None if the template has not been uploaded.
+        """
+        layout = self._get_struct_layout(structure_handle)
+        if layout is None and tag is not None:
+            udt = self._get_tag_udt(tag)  # uploads the template if using lazy_udts
+            if udt is not None and udt['template']['structure_handle'] == structure_handle:
+                instance_id = udt['template_instance_id']
+                with self._metadata.lock:
+                    self._udt_cache.setdefault(instance_id, udt)
+                    self._struct_handles[structure_handle] = instance_id
+                layout = self._get_layout(instance_id)
+        return layout
+
+    def _decode_struct(self, data, tag=None, strings=False):
+        """
+        decodes the data of a structure value, starting with the structure handle
 
-        return self._udt_cache[tag['template_instance_id']]
+        :param tag: the tag read, used to find its template if the structure handle is unknown
+        :param strings: decode the structure as a string if its template is unknown
+        :return: (value, udt name)
+        """
+        structure_handle = unpack_uint(data[:2])
+        layout = self._tag_struct_layout(structure_handle, tag)
+        if layout is not None:
+            return layout.decode(data, 2), layout.name
+        if strings:  # LEN then DATA for the rest of the structure
+            return decode_string(data, 2), 'STRING'
+        raise DataError(_unknown_structure(structure_handle))
+
+    def _array_elements(self, tags):
+        """
+        the number of elements from each of `tags` to the end of its array, the dimensions of the arrays are
+        requested the first time they're needed
+
+        :return: {tag: number of elements}
+        """
+        self._get_array_dimensions([self._tags.base_tag(tag) for tag in tags])
+        counts = {}
+        for tag in tags:
+            count = self._tags.elements(tag)
+            if count is None:
+                self._status = (7, f"Size of array {tag} is unknown, it's not in the tag list")
+                raise DataError(self._status[1])
+            counts[tag] = count
+        return counts
+
+    def _get_array_dimensions(self, tags):
+        """
+        get the element size and dimensions (Symbol attributes 7 and 8) of the array tags in `tags` (TagInfo),
+        they're not included in the tag list upload to keep it small so they're requested in batches when needed
+        """
+        tags = [tag for tag in tags if tag is not None and tag.dimensions is None]
+        if not tags:
+            return
+        if not self._target_is_connected:
+            if not self.forward_open():
+                self._status = (7, "Target did not connected. read_array will not be executed.")
+                self.__log.warning(self._status)
+                raise DataError(self._status[1])
+
+        requests = [self._symbol_attributes_request(tag) for tag in tags]
+        for infos, replies in self._send_multiple_service(requests, tags, SYMBOL_ATTRIBUTES_REPLY_SIZE):
+            for tag, (status, data) in zip(infos, replies):
+                try:
+                    _, _, size_status, element_size, _, dims_status, *dimensions = _SYMBOL_ATTRIBUTES.unpack(data)
+                except struct.error:
+                    status = status or 'invalid reply'
+                else:
+                    status = status or size_status or dims_status
+                if status:
+                    self.__log.warning(f'Failed to get the dimensions of {tag.tag_name}, status: {status}')
+                    continue
+                tag.element_size = element_size
+                tag.dimensions = tuple(dimensions[:tag.dim])
+
+    def _symbol_attributes_request(self, tag):
+        path = self._program_path(self._tag_scope(tag.tag_name, self._tag_list_scope)) + b''.join([
+            CLASS_ID["8-bit"],
+            CLASS_CODE["Symbol Object"],
+            INSTANCE_ID["16-bit"],
+            b'\x00',
+            pack_uint(tag.instance_id),
+        ])
+        return b''.join([
+            bytes([TAG_SERVICES_REQUEST['Get Attributes']]),
+            pack_usint(len(path) // 2),
+            path,
+            b'\x02\x00',  # Number of attributes
+            b'\x07\x00',  # Element size UINT
+            b'\x08\x00',  # Array dimensions 3 x UDINT
+        ])
+
+    def _estimate_read_size(self, tag):
+        """ size of (an element of) `tag`, used to keep multi-request replies within the connection size """
+        info = self._tags.lookup(tag)
+        if info is None or not info[2]:
+            return 8  # largest atomic type
+        return info[2]
+
+    def _prefetch_templates(self, tags):
+        """
+        upload the templates of the structure tags in `tags` that haven't been resolved yet (see `lazy_udts`) in one
+        batch, instead of one tag at a time when their sizes or udts are looked up
+        """
+        instance_ids = set()
+        for tag in tags:
+            info = self._tags.base_tag(tag)
+            if info is not None and info.tag_type == 'struct' and not info.udt:
+                instance_ids.add(info.template_instance_id)
+        if instance_ids:
+            self._upload_templates(instance_ids)
 
     def _parse_fragment(self, reply, last_idx, offset, tags, raw=False):
         """ parse the fragment returned by a fragment service."""
@@ -1142,24 +2443,28 @@ class LogixDriver(Base):
             status = _unit_data_status(reply)
             data_type = unpack_uint(reply[REPLY_START:REPLY_START + 2])
             fragment_returned = reply[REPLY_START + 2:]
+            typ = DATA_TYPE[data_type]
         except Exception as e:
             raise DataError(e)
 
         fragment_returned_length = len(fragment_returned)
-        idx = 0
-        while idx < fragment_returned_length:
+        if raw:
+            tags += fragment_returned
+        elif typ in ARRAY_TYPECODE:
             try:
-                typ = DATA_TYPE[data_type]
-                if raw:
-                    value = fragment_returned[idx:idx + DATA_FUNCTION_SIZE[typ]]
-                else:
-                    value = UNPACK_DATA_FUNCTION[typ](fragment_returned[idx:idx + DATA_FUNCTION_SIZE[typ]])
-                idx += DATA_FUNCTION_SIZE[typ]
+                values = unpack_array(fragment_returned, typ)
             except Exception as e:
                 raise DataError(e)
-            if raw:
-                tags += value
-            else:
+            tags.extend(enumerate(values, last_idx))
+            last_idx += len(values)
+        else:
+            idx = 0
+            while idx < fragment_returned_length:
+                try:
+                    value = UNPACK_DATA_FUNCTION[typ](fragment_returned[idx:idx + DATA_FUNCTION_SIZE[typ]])
+                    idx += DATA_FUNCTION_SIZE[typ]
+                except Exception as e:
+                    raise DataError(e)
                 tags.append((last_idx, value))
                 last_idx += 1
 
@@ -1172,43 +2477,119 @@ class LogixDriver(Base):
             self.__log.warning(self._status)
             offset = -1
 
-        return last_idx, offset
+        return last_idx, offset, typ
 
-    def _parse_multiple_request_read(self, reply, tags, tag_bits=None):
+    def _parse_multiple_request_read(self, reply, tags, columns=None, errors=None, strings=False):
         """ parse the message received from a multi request read:
 
-        For each tag parsed, the information extracted includes the tag name, the value read and the data type.
-        Those information are appended to the tag list as tuple
+        For each tag parsed, the information extracted includes the tag name, the value read, the data type and the
+        general status of the read.  Those are appended to the lists in `columns`, no per-tag tuple is created.
 
-        :return: the tag list
+        :param tags: list of (tag, bits) for each service, bits is a list of the bits to return if reading the
+                     bits of an integer, else None
+        :param columns: dict of lists to append the results to, as returned by `read_tag(..., columns=True)`
+        :param errors: optional dict to add {index in columns: error} to for values that could not be decoded
+        :param strings: decode structures with an unknown template as strings, see `_decode_struct`
+        :return: the columns dict
         """
         offset = 50
         position = 50
-        tag_bits = tag_bits or {}
+        if columns is None:
+            columns = {'tag': [], 'value': [], 'type': [], 'status': [], 'timestamp': None}
+        names, values, types, statuses = columns['tag'], columns['value'], columns['type'], columns['status']
         try:
             number_of_service_replies = unpack_uint(reply[offset:offset + 2])
-            tag_list = []
             for index in range(number_of_service_replies):
                 position += 2
                 start = offset + unpack_uint(reply[position:position + 2])
                 general_status = unpack_usint(reply[start + 2:start + 3])
-                tag = tags[index]
+                tag, bits = tags[index]
                 if general_status == 0:
-                    typ = DATA_TYPE[unpack_uint(reply[start + 4:start + 6])]
-                    value_begin = start + 6
-                    value_end = value_begin + DATA_FUNCTION_SIZE[typ]
-                    value = UNPACK_DATA_FUNCTION[typ](reply[value_begin:value_end])
-                    if tag in tag_bits:
-                        for bit in tag_bits[tag]:
-                            val = bool(value & (1 << bit)) if bit < BITS_PER_INT_TYPE[typ] else None
-                            tag_list.append((f'{tag}.{bit}', val, 'BOOL'))
+                    data_type = unpack_uint(reply[start + 4:start + 6])
+                    if data_type == STRUCTURE_READ_REPLY:
+                        last = index == number_of_service_replies - 1
+                        end = len(reply) if last else offset + unpack_uint(reply[position + 2:position + 4])
+                        try:
+                            value, typ = self._decode_struct(reply[start + 6:end], tag, strings)
+                        except DataError as err:
+                            self.__log.warning(f'Failed to decode {tag}: {err}')
+                            value, typ = None, None
+                            if errors is not None:
+                                errors[len(names)] = str(err)
                     else:
-                        self._last_tag_read = (tag, value, typ)
-                        tag_list.append(self._last_tag_read)
+                        typ = DATA_TYPE[data_type]
+                        value_begin = start + 6
+                        value_end = value_begin + DATA_FUNCTION_SIZE[typ]
+                        value = UNPACK_DATA_FUNCTION[typ](reply[value_begin:value_end])
+                        if bits is not None:
+                            for bit in bits:
+                                names.append(f'{tag}.{bit}')
+                                values.append(bool(value & (1 << bit)) if bit < BITS_PER_INT_TYPE[typ] else None)
+                                types.append('BOOL')
+                                statuses.append(general_status)
+                            continue
+                elif bits is not None:  # a result for each bit requested
+                    names += [f'{tag}.{bit}' for bit in bits]
+                    values += [None] * len(bits)
+                    types += [None] * len(bits)
+                    statuses += [general_status] * len(bits)
+                    continue
                 else:
-                    self._last_tag_read = (tag, None, None)
-                    tag_list.append(self._last_tag_read)
+                    value, typ = None, None
+
+                names.append(tag)
+                values.append(value)
+                types.append(typ)
+                statuses.append(general_status)
+
+            if names:
+                self._last_tag_read = Tag(names[-1], values[-1], types[-1], status_error(statuses[-1]))
+            return columns
+        except Exception as e:
+            raise DataError(e)
+
+    def _parse_multiple_request_lazy(self, reply, tags):
+        """ parse the message received from a multi request read without decoding the values
 
+        Only the offsets and data type of each value are recorded, against a view of the reply shared by all the
+        results.  The values are decoded by the LazyTag the first time they're accessed.
+
+        :param tags: list of (tag, bits) for each service, like `_parse_multiple_request_read`
+        :return: list of LazyTag (or Tag for failed reads)
+        """
+        offset = REPLY_START
+        view = memoryview(reply)
+        try:
+            number_of_service_replies = unpack_uint(reply[offset:offset + 2])
+            starts = [offset + unpack_uint(reply[offset + 2 + (i * 2):offset + 4 + (i * 2)])
+                      for i in range(number_of_service_replies)]
+            tag_list = []
+            for (tag, bits), start, end in zip(tags, starts, starts[1:] + [len(reply)]):
+                general_status = unpack_usint(reply[start + 2:start + 3])
+                if general_status != SUCCESS:
+                    error = status_error(general_status)
+                    if bits is not None:
+                        tag_list += [Tag(f'{tag}.{bit}', error=error) for bit in bits]
+                    else:
+                        tag_list.append(Tag(tag, error=error))
+                    continue
+
+                data_type = unpack_uint(reply[start + 4:start + 6])
+                if data_type != STRUCTURE_READ_REPLY:
+                    end = start + 6 + DATA_FUNCTION_SIZE[DATA_TYPE[data_type]]
+                else:
+                    structure_handle = unpack_uint(reply[start + 6:start + 8])
+                    if self._tag_struct_layout(structure_handle, tag) is None:
+                        tag_list.append(Tag(tag, error=_unknown_structure(structure_handle)))
+                        continue
+                if bits is not None:
+                    tag_list += [LazyTag(f'{tag}.{bit}', view, start + 6, end, data_type, bit, self._decode_value)
+                                 for bit in bits]
+                else:
+                    tag_list.append(LazyTag(tag, view, start + 6, end, data_type, None, self._decode_value))
+
+            if tag_list:
+                self._last_tag_read = tag_list[-1]
             return tag_list
         except Exception as e:
             raise DataError(e)
@@ -1217,7 +2598,7 @@ class LogixDriver(Base):
         """ parse the message received from a multi request writ:
 
         For each tag parsed, the information extracted includes the tag name and the status of the writing.
-        Those information are appended to the tag list as tuple
+        Those information are appended to the tag list as a Tag, with the error set if the write failed
 
         :return: the tag list
         """
@@ -1232,7 +2613,7 @@ class LogixDriver(Base):
                 start = offset + unpack_uint(reply[position:position + 2])
                 general_status = unpack_usint(reply[start + 2:start + 3])
 
-                self._last_tag_write = (tags[index] + (general_status == 0,))
+                self._last_tag_write = Tag(*tags[index], error=status_error(general_status))
                 tag_list.append(self._last_tag_write)
             return tag_list
         except Exception as e:
@@ -1242,7 +2623,7 @@ class LogixDriver(Base):
     def last_tag_read(self):
         """ Return the last tag read by a multi request read
 
-        :return: A tuple (tag name, value, type)
+        :return: A Tag (tag name, value, type, error)
         """
         return self._last_tag_read
 
@@ -1250,7 +2631,7 @@ class LogixDriver(Base):
     def last_tag_write(self):
         """ Return the last tag write by a multi request write
 
-        :return: A tuple (tag name, 'GOOD') if the write was successful otherwise (tag name, 'BAD')
+        :return: A Tag (tag name, value, type, error), error is None if the write was successful
         """
         return self._last_tag_write
 
@@ -1261,3 +2642,62 @@ class LogixDriver(Base):
 
 def _unit_data_status(reply):
     return unpack_usint(reply[48:49])
+
+
+def _template_members(data, member_count):
+    """
+    parse the body of a template read with the Read Template service, the member definitions are followed by the
+    name table, the template name then the member names, each null terminated
+
+    :return: (template name, list of (member name, info, type code, offset) for each member)
+    """
+    view = memoryview(data)
+    template_name, *names = bytes(view[member_count * 8:]).decode(errors='replace').split('\x00', member_count + 1)
+    names += [f'__member{i}' for i in range(len(names), member_count)]  # missing names are hidden members
+    return template_name, [(name, *definition)
+                           for name, definition in zip(names, _MEMBER_DEFINITION.iter_unpack(view[:member_count * 8]))]
+
+
+def _instance_attribute_list(reply):
+    """
+    generator of (instance id, symbol name, symbol type) for each symbol in a Get Instance Attribute List reply
+    for attributes 1 (name) and 2 (symbol type)
+    """
+    offset, end = REPLY_START, len(reply)
+    while offset < end:
+        instance, name_length = _SYMBOL_HEADER.unpack_from(reply, offset)
+        offset += 6 + name_length
+        yield instance, reply[offset - name_length:offset], _UINT.unpack_from(reply, offset)[0]
+        offset += 2
+
+
+_SYMBOL_HEADER = struct.Struct('<IH')  # instance id, name length
+_UINT = struct.Struct('<H')
+# attribute count, then (id, status, value) of the element size and the array dimensions
+_SYMBOL_ATTRIBUTES = struct.Struct('<HHHHHH3I')
+_MEMBER_DEFINITION = struct.Struct('<HHI')  # info (array size or bit number), type code, offset
+
+
+def _program_scope(scope):
+    """ the name of a program scope with the 'Program:' prefix, None for the controller scope """
+    if scope is None or scope.startswith('Program:'):
+        return scope
+    return f'Program:{scope}'
+
+
+def _unknown_structure(structure_handle):
+    return f'template of the structure (handle {structure_handle:#06x}) has not been uploaded'
+
+
+def _multiple_service_replies(reply):
+    """ split the reply of a multi-service request into (general status, reply data) for each service """
+    offset = REPLY_START
+    count = unpack_uint(reply[offset:offset + 2])
+    starts = [offset + unpack_uint(reply[offset + 2 + (i * 2):offset + 4 + (i * 2)]) for i in range(count)]
+    view = memoryview(reply)
+    replies = []
+    for start, end in zip(starts, starts[1:] + [len(reply)]):
+        status = reply[start + 2]
+        extended_status_size = reply[start + 3] * 2
+        replies.append((status, view[start + 4 + extended_status_size:end]))
+    return replies
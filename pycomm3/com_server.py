@@ -68,3 +68,19 @@ class LogixDriverCOMServer(LogixDriver):
     @large_packets.setter
     def large_packets(self, value):
         self['extended forward open'] = value
+
+    def read_tag(self, *tags):
+        # COM can only return sequences, not Tag objects
+        result = super().read_tag(*tags)
+        return [tuple(r) for r in result] if isinstance(result, list) else tuple(result)
+
+    def write_tag(self, tag, value=None, typ=None):
+        result = super().write_tag(tag, value, typ)
+        return [tuple(r) for r in result] if isinstance(result, list) else tuple(result)
+
+    def write_string(self, tag, value, size=82):
+        return bool(super().write_string(tag, value, size))
+
+    def get_tag_list(self, program=None, cache=True, refresh=False):
+        # TagInfo are converted to plain dicts
+        return [dict(info.items()) for info in super().get_tag_list(program, cache, refresh)]
@@ -28,9 +28,16 @@ HEADER_SIZE = 24
 
 # used to estimate packet size  and determine
 # when to start a new packet
+MULTISERVICE_REQUEST_HEADER = 10  # sequence, service, path and number of services
 MULTISERVICE_READ_OVERHEAD = 6
 MULTISERVICE_WRITE_OVERHEAD = 3
+MULTISERVICE_READ_REPLY_OVERHEAD = 10  # offset, reply service and status, data type and structure handle
+TEMPLATE_ATTRIBUTES_REPLY_SIZE = 32  # reply to the Get Attributes service for the 4 template attributes
+SYMBOL_ATTRIBUTES_REPLY_SIZE = 24  # reply to the Get Attributes service for the element size and dimensions
 MIN_VER_INSTANCE_IDS = 21  # using Symbol Instance Addressing not supported below version 21
+TAG_CACHE_VERSION = 4  # increment when the format of the cached tag list/templates changes
+SNAPSHOT_MAGIC = b'PYCOMM3S'
+SNAPSHOT_VERSION = 1  # increment when the layout of tag snapshot files changes
 MIN_VER_LARGE_CONNECTIONS = 20  # >500 byte connections not supported below logix v20
 EXTENDED_SYMBOL = b'\x91'
 BOOL_ONE = 0xff
@@ -38,9 +45,12 @@ REQUEST_SERVICE = 0
 REQUEST_PATH_SIZE = b'\x03'
 REQUEST_PATH = 2
 SUCCESS = 0
+MULTI_SERVICE_REPLY = 0x8A  # reply service of the Multiple Service Packet service
 INSUFFICIENT_PACKETS = 6
+EMBEDDED_SERVICE_ERROR = 0x1E  # multiple service packet with at least one failed service, see the reply of each
 OFFSET_MESSAGE_REQUEST = 40
 REPLY_START = 50
+STRUCTURE_READ_REPLY = 0x02a0  # type code of a structure in a read reply, followed by the structure handle
 FORWARD_CLOSE = b'\x4e'
 UNCONNECTED_SEND = b'\x52'
 FORWARD_OPEN = b'\x54'
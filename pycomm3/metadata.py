@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#
+# metadata.py - Tag list and template caches shared by the drivers for a controller
+#
+# Copyright (c) 2019 Ian Ottoway <ian@ottoway.dev>
+# Copyright (c) 2014 Agostino Ruscito <ruscito@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+import threading
+
+
+class ControllerMetadata:
+    """
+    The caches of the tag list and templates uploaded from a controller.  All the drivers in a process connected to
+    the same controller use the same instance, so templates are only uploaded once and a driver can reuse the tag
+    list uploaded by another.  The caches are plain dicts, changes to them are made while holding `lock`, but not
+    the requests that upload their contents.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.drivers = 0  # number of drivers using the caches
+        self.instance_ids = {}
+        self.structs = {}
+        self.templates = {}
+        self.udts = {}
+        self.layouts = {}
+        self.struct_handles = {}  # structure handle -> template instance id of the udt, None if it's not uploaded
+        self.tag_list = None  # (program, {tag name: TagInfo}, symbol probes, program names) of the last upload
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def attach_metadata(key, metadata=None, replace=False):
+    """
+    the shared metadata for the controller identified by `key`, the first driver to attach provides it
+
+    :param metadata: the caches the driver already has, they're shared if no other driver is attached
+    :param replace: share `metadata` instead of the current metadata, the drivers already attached keep using theirs
+    """
+    with _controllers_lock:
+        if key in _controllers and not replace:
+            metadata = _controllers[key]
+        else:
+            metadata = _controllers[key] = metadata if metadata is not None else ControllerMetadata()
+        metadata.drivers += 1
+        return metadata
+
+
+def detach_metadata(key, metadata):
+    """ release the metadata for a driver, it's removed once no driver uses it """
+    with _controllers_lock:
+        metadata.drivers -= 1
+        if metadata.drivers <= 0 and _controllers.get(key) is metadata:
+            del _controllers[key]
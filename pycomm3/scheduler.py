@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+#
+# scheduler.py - Periodic reading of tags in scan classes
+#
+# Copyright (c) 2019 Ian Ottoway <ian@ottoway.dev>
+# Copyright (c) 2014 Agostino Ruscito <ruscito@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+import math
+import threading
+import time
+from collections import deque
+
+from autologging import logged
+
+from . import PycommError
+from .tag import LazyTag, changed_tags
+
+
+class ScanClass:
+    """
+    A group of tags read every `period` seconds, and the timing of its scans.  Created by
+    `ScanScheduler.add_scan_class`.
+    """
+
+    def __init__(self, name, period, tags, callback=None, history=1000):
+        self.name = name
+        self.period = period
+        self.tags = list(tags)
+        self.callback = callback
+        self.next_due = None  # deadline of the next scan, from time.monotonic()
+        self.scans = 0
+        self.overruns = 0  # deadlines missed because the previous scans took too long
+        self.errors = 0
+        self._starts = deque(maxlen=2)
+        self._periods = deque(maxlen=history)
+        self._latencies = deque(maxlen=history)
+
+    def _scanned(self, start, end):
+        """ record a scan started at `start` that was due at `next_due`, and schedule the next one """
+        if self._starts:
+            self._periods.append(start - self._starts[-1])
+        self._starts.append(start)
+        self._latencies.append(end - self.next_due)
+        self.scans += 1
+        self.next_due += self.period
+        if self.next_due <= end:  # skip the deadlines that have passed instead of bursting to catch up
+            missed = math.floor((end - self.next_due) / self.period) + 1
+            self.overruns += missed
+            self.next_due += missed * self.period
+
+    def stats(self):
+        """
+        the timing of the recent scans, times are in seconds:
+
+        - period: the configured period
+        - actual_period: the average time between the start of scans
+        - scans, overruns, errors: the number of scans, missed deadlines and failed reads since the class was added
+        - latency: percentiles (p50, p90, p99 and max) of the time from the deadline of a scan to its results
+        """
+        latencies = sorted(self._latencies)
+        return {
+            'period': self.period,
+            'actual_period': sum(self._periods) / len(self._periods) if self._periods else None,
+            'scans': self.scans,
+            'overruns': self.overruns,
+            'errors': self.errors,
+            'latency': {'p50': _percentile(latencies, 50), 'p90': _percentile(latencies, 90),
+                        'p99': _percentile(latencies, 99), 'max': latencies[-1] if latencies else None},
+        }
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(name={self.name!r}, period={self.period!r}, tags={len(self.tags)})'
+
+
+@logged
+class ScanScheduler:
+    """
+    Reads groups of tags (scan classes) periodically, e.g. a 50 ms class for the fast changing tags and a 5 s class
+    for the rest::
+
+        scheduler = ScanScheduler(plc)
+        scheduler.add_scan_class('fast', 0.05, ['Speed', 'Position'], callback=on_fast)
+        scheduler.add_scan_class('slow', 5, ['Recipe', 'Counts'], callback=on_slow)
+        scheduler.start()  # or scheduler.run() to scan in the current thread
+        ...
+        scheduler.stop()
+        print(scheduler.stats())
+
+    Scans are scheduled on fixed deadlines (start + n * period) so they don't drift, a scan that is late doesn't
+    delay the following ones.  All the classes that are due are read together, so their tags share the same
+    multi-service packets and a tag in more than one class is only read once, if that read fails the classes are read
+    separately so only the classes it failed for count an error.  The callback of a class is called
+    with the results (`LazyTag`) of its tags, in the same order, from the thread running the scheduler.
+
+    The driver is not thread-safe, while the scheduler is running in its own thread the driver should only be used
+    from the callbacks.
+    """
+
+    def __init__(self, plc, history=1000):
+        """
+        :param plc: the LogixDriver to read the tags with
+        :param history: number of scans of each class kept for the statistics
+        """
+        self.plc = plc
+        self.history = history
+        self._classes = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()  # set when the scan classes change or to stop, `run` checks what's due again
+        self._thread = None
+
+    def add_scan_class(self, name, period, tags, callback=None):
+        """
+        add (or replace) a scan class, its first scan is due immediately
+
+        :param name: name of the scan class
+        :param period: time between scans, in seconds
+        :param tags: tag names to read
+        :param callback: callable(results) called with the results of each scan
+        :return: the ScanClass
+        """
+        if period <= 0:
+            raise ValueError('period must be greater than 0')
+        scan_class = ScanClass(name, period, tags, callback, self.history)
+        scan_class.next_due = time.monotonic()
+        with self._lock:
+            self._classes[name] = scan_class
+        self._wake.set()
+        return scan_class
+
+    def remove_scan_class(self, name):
+        with self._lock:
+            scan_class = self._classes.pop(name, None)
+        self._wake.set()
+        return scan_class
+
+    @property
+    def scan_classes(self):
+        """ the scan classes, {name: ScanClass} """
+        with self._lock:
+            return dict(self._classes)
+
+    def run_once(self):
+        """
+        scan all the classes that are due, their tags are read together
+
+        :return: the time until the next scan is due (seconds), None if there are no scan classes
+        """
+        with self._lock:
+            classes = list(self._classes.values())
+        if not classes:
+            return None
+
+        start = time.monotonic()
+        due = [scan_class for scan_class in classes if scan_class.next_due <= start]
+        if due:
+            scans = self._read(due)
+            end = time.monotonic()
+
+            for scan_class, results in zip(due, scans):
+                scan_class._scanned(start, end)
+                if results is None:
+                    scan_class.errors += 1
+                elif scan_class.callback is not None:
+                    try:
+                        scan_class.callback(results)
+                    except Exception:
+                        self.__log.exception(f'Error in the callback of scan class {scan_class.name}')
+
+        return max(min(scan_class.next_due for scan_class in classes) - time.monotonic(), 0)
+
+    def _read(self, scan_classes):
+        """
+        read the tags of the scan classes together, if that fails each class is read separately so only the classes
+        with a tag that can't be read fail
+
+        :return: the results of each class, None for the classes that failed
+        """
+        tags = list(dict.fromkeys(tag for scan_class in scan_classes for tag in scan_class.tags))
+        index = {tag: i for i, tag in enumerate(tags)}  # results are in the same order as the tags
+        try:
+            results = self.plc.read_tag(tags, lazy=True) if tags else []
+        except PycommError:
+            if len(scan_classes) > 1:
+                return [self._read([scan_class])[0] for scan_class in scan_classes]
+            self.__log.exception(f'Failed to read the tags of scan class {scan_classes[0].name}')
+            return [None]
+        return [[results[index[tag]] for tag in scan_class.tags] for scan_class in scan_classes]
+
+    def run(self):
+        """ scan until `stop` is called """
+        try:
+            while not self._stop.is_set():
+                self._wake.clear()  # cleared before scanning, so changes made during the scan aren't missed
+                wait = self.run_once()
+                self._wake.wait(wait)  # until the next scan is due, or the scan classes change
+        finally:
+            self._stop.clear()
+
+    def start(self):
+        """ run the scheduler in a background thread """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name='pycomm3-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """ stop the scheduler and wait for the current scan to finish """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self):
+        """ the statistics of each scan class, {name: `ScanClass.stats`} """
+        return {name: scan_class.stats() for name, scan_class in self.scan_classes.items()}
+
+
+class Subscription:
+    """
+    The callback of a scan class that calls `callback` with only the results that changed since they were last
+    reported (all of them on the first scan), created by `LogixDriver.subscribe`.  Values are compared using the
+    raw values from the reply, so unchanged values are never decoded.
+    """
+
+    def __init__(self, scheduler, name, callback, deadband=None, percent=False):
+        self.name = name
+        self.callback = callback
+        self.deadband = deadband
+        self.percent = percent
+        self._scheduler = scheduler
+        self._last = {}  # the last reported result of each tag, deadbands are relative to them
+
+    def __call__(self, results):
+        changed = changed_tags(self._last, results, self.deadband, self.percent)
+        if changed:
+            for result in changed:  # detached, a tag that rarely changes would keep its whole reply in memory
+                self._last[result.tag] = result.detach() if isinstance(result, LazyTag) else result
+            self.callback(changed)
+
+    def cancel(self):
+        """ stop the subscription """
+        self._scheduler.remove_scan_class(self.name)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(name={self.name!r}, deadband={self.deadband!r}, percent={self.percent!r})'
+
+
+def _percentile(values, percent):
+    """ nearest-rank percentile of the sorted `values` """
+    if not values:
+        return None
+    return values[max(math.ceil(percent / 100 * len(values)) - 1, 0)]
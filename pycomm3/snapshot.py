@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#
+# snapshot.py - Binary snapshots of an uploaded tag list
+#
+# Copyright (c) 2019 Ian Ottoway <ian@ottoway.dev>
+# Copyright (c) 2014 Agostino Ruscito <ruscito@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+"""
+A snapshot is a flat binary file of the symbols and templates uploaded from a controller, the same data the
+controller returns for the Get Instance Attribute List and template services.  Unlike the pickle tag cache, loading
+a snapshot doesn't execute anything from the file, so one process can upload the tag list and share the snapshot with
+any number of workers.  The file is read through a read-only mmap, so workers attaching to the same file (e.g. on
+/dev/shm) share the pages.
+
+Layout, all little-endian:
+
+    header
+    meta strings        4 x (offset, length): serial, revision, name, tag list scope
+    scopes              (offset, length, max instance, number of instances) of each program scope,
+                        the empty name is the controller scope
+    symbols             (offset, length, scope, instance id, symbol type) of each tag
+    templates           (instance id, object definition size, structure size, member count, structure handle,
+                         offset, length) of each template
+    strings             utf-8 names
+    template bodies     as returned by the Read Template service
+"""
+
+import mmap
+import os
+import struct
+
+from . import DataError
+from .const import SNAPSHOT_MAGIC, SNAPSHOT_VERSION
+
+_HEADER = struct.Struct('<8sHxxIIII')  # magic, version, scopes, symbols, templates, size of the strings
+_STRING = struct.Struct('<IHxx')
+_SCOPE = struct.Struct('<IHxxII')
+_SYMBOL = struct.Struct('<IHHIHxx')
+_TEMPLATE = struct.Struct('<IIIHHII')
+_NO_PROBE = 0xffffffff
+
+
+def write_snapshot(path, info, tag_list_scope, scopes, symbols, templates):
+    """
+    write a snapshot file
+
+    :param info: dict with the serial, revision and name of the controller
+    :param tag_list_scope: the `program` argument of get_tag_list for the tag list
+    :param scopes: list of (program scope, (max instance, number of instances) or None), None is the controller scope,
+                   the scopes of the tag list followed by any other programs
+    :param symbols: list of (scope index, instance id, name, symbol type) for each tag, sorted by scope
+    :param templates: list of (instance id, structure makeup dict, template body)
+    """
+    strings = bytearray()
+
+    def string(value):
+        data = value.encode('utf-8')
+        strings.extend(data)
+        return len(strings) - len(data), len(data)
+
+    meta = [_STRING.pack(*string(str(info.get(key) or ''))) for key in ('serial', 'revision', 'name')]
+    meta.append(_STRING.pack(*string(tag_list_scope or '')))  # '' is None, program names are never empty
+    scope_records = [_SCOPE.pack(*string(scope or ''), *(probe or (_NO_PROBE, _NO_PROBE)))
+                     for scope, probe in scopes]
+    symbol_records = [_SYMBOL.pack(*string(name), scope, instance_id, symbol_type)
+                      for scope, instance_id, name, symbol_type in symbols]
+
+    bodies = bytearray()
+    template_records = []
+    for instance_id, makeup, body in templates:
+        template_records.append(_TEMPLATE.pack(instance_id, makeup['object_definition_size'], makeup['structure_size'],
+                                               makeup['member_count'], makeup['structure_handle'],
+                                               len(bodies), len(body)))
+        bodies.extend(body)
+
+    header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(scope_records), len(symbol_records),
+                          len(template_records), len(strings))
+    tmp = f'{path}.{os.getpid()}.tmp'  # workers never see a partial file
+    with open(tmp, 'wb') as f:
+        f.write(b''.join([header, *meta, *scope_records, *symbol_records, *template_records, strings, bodies]))
+    os.replace(tmp, path)
+
+
+class TagSnapshot:
+    """
+    A snapshot file opened read-only, use as a context manager::
+
+        with TagSnapshot(path) as snapshot:
+            for scope, instance_id, name, symbol_type in snapshot.symbols():
+                ...
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            try:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError) as err:  # empty file or not a regular file
+                raise DataError(f'Invalid tag snapshot {path}: {err}')
+        try:
+            magic, version, scope_count, symbol_count, template_count, strings_size = _HEADER.unpack_from(self._data)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                raise DataError(f'{path} is not a tag snapshot (version {SNAPSHOT_VERSION})')
+
+            meta = _HEADER.size
+            scopes = meta + 4 * _STRING.size
+            self._symbols = scopes + scope_count * _SCOPE.size
+            self._templates = self._symbols + symbol_count * _SYMBOL.size
+            self._strings = self._templates + template_count * _TEMPLATE.size
+            self._bodies = self._strings + strings_size
+            if self._bodies > len(self._data):
+                raise DataError(f'Invalid tag snapshot {path}: truncated file')
+
+            serial, revision, name, tag_list_scope = (self._string(*record[:2]) for record in
+                                                      _STRING.iter_unpack(self._data[meta:scopes]))
+            self.info = {'serial': serial, 'revision': revision, 'name': name}
+            self.tag_list_scope = tag_list_scope or None
+            self.scopes = [(self._string(offset, length) or None,
+                            None if max_instance == _NO_PROBE else (max_instance, instances))
+                           for offset, length, max_instance, instances in
+                           _SCOPE.iter_unpack(self._data[scopes:self._symbols])]
+        except (struct.error, UnicodeError) as err:
+            self.close()
+            raise DataError(f'Invalid tag snapshot {path}: {err}')
+        except DataError:
+            self.close()
+            raise
+
+    def _string(self, offset, length):
+        return self._data[self._strings + offset:self._strings + offset + length].decode('utf-8')
+
+    def symbols(self):
+        """ generator of (scope index, instance id, name (bytes), symbol type) for each tag """
+        data, strings = self._data, self._strings
+        for offset in range(self._symbols, self._templates, _SYMBOL.size):
+            name_offset, length, scope, instance_id, symbol_type = _SYMBOL.unpack_from(data, offset)
+            yield scope, instance_id, data[strings + name_offset:strings + name_offset + length], symbol_type
+
+    def templates(self):
+        """ generator of (instance id, structure makeup dict, template body) for each template """
+        data = self._data
+        for offset in range(self._templates, self._strings, _TEMPLATE.size):
+            instance_id, ods, size, member_count, handle, body, length = _TEMPLATE.unpack_from(data, offset)
+            makeup = {'object_definition_size': ods, 'structure_size': size, 'member_count': member_count,
+                      'structure_handle': handle}
+            yield instance_id, makeup, data[self._bodies + body:self._bodies + body + length]
+
+    def close(self):
+        self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,511 @@
+# -*- coding: utf-8 -*-
+#
+# tag.py - Result and tag metadata objects returned by the drivers
+#
+# Copyright (c) 2019 Ian Ottoway <ian@ottoway.dev>
+# Copyright (c) 2014 Agostino Ruscito <ruscito@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+import re
+from bisect import bisect_left
+
+from .bytes_ import DATA_FUNCTION_SIZE
+from .const import SERVICE_STATUS, DATA_TYPE
+from .udt import is_hidden_member
+
+
+def status_error(status):
+    """ the error message for a CIP general status, None for success """
+    if not status:
+        return None
+    return SERVICE_STATUS.get(status, f'Unknown status: {status:#04x}')
+
+
+class Tag:
+    """
+    The result of reading or writing a tag, the same shape is used for every read/write method.
+
+    ``error`` is None if the read/write was successful, otherwise it is the error message of the status
+    returned by the controller for this tag.  A result is truthy only if it was successful, so
+    ``if plc.write_tag('Tag1', 1, 'DINT'):`` works as before.  Results can be unpacked like a tuple:
+    ``tag, value, typ, error = plc.read_tag('Tag1')``
+    """
+    __slots__ = ('tag', 'value', 'type', 'error')
+
+    def __init__(self, tag, value=None, type=None, error=None):
+        self.tag = tag
+        self.value = value
+        self.type = type
+        self.error = error
+
+    def __bool__(self):
+        return self.error is None
+
+    def __iter__(self):
+        return iter((self.tag, self.value, self.type, self.error))
+
+    def __eq__(self, other):
+        if isinstance(other, Tag):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.tag, self.type, self.error))  # values may be lists or dicts, equal tags still hash equal
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(tag={self.tag!r}, value={self.value!r}, type={self.type!r}, ' \
+               f'error={self.error!r})'
+
+    def __str__(self):
+        return f'{self.tag}, {self.value!r}, {self.type}, {self.error}'
+
+
+class TagInfo:
+    """
+    The definition of a tag from the tag list, also supports dict style access for the attributes:
+    ``plc.tags['Tag1']['data_type']`` or ``plc.tags['Tag1'].get('udt')``
+    """
+    __slots__ = ('tag_name', 'instance_id', 'tag_type', 'data_type', 'dim', 'bit_position',
+                 'template_instance_id', 'template', 'udt', 'dimensions', 'element_size')
+
+    def __init__(self, tag_name, instance_id, tag_type, data_type, dim=0, bit_position=None,
+                 template_instance_id=None, template=None, udt=None, dimensions=(), element_size=None):
+        self.tag_name = tag_name
+        self.instance_id = instance_id
+        self.tag_type = tag_type
+        self.data_type = data_type
+        self.dim = dim
+        self.bit_position = bit_position
+        self.template_instance_id = template_instance_id
+        self.template = template
+        self.udt = udt
+        self.dimensions = dimensions  # the size of each dimension of an array, () if not an array, None if unknown
+        self.element_size = element_size
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__ and getattr(self, key) is not None
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+    def keys(self):
+        return [key for key in self.__slots__ if getattr(self, key) is not None]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, TagInfo):
+            return self.items() == other.items()
+        return NotImplemented
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({dict(self.items())!r})'
+
+    def copy(self):
+        """ a copy of the tag info, the template and udt definitions are not copied """
+        info = TagInfo.__new__(TagInfo)
+        info.__setstate__(self.__getstate__())
+        return info
+
+    def __getstate__(self):
+        return tuple(getattr(self, key) for key in self.__slots__)  # pickled without the attribute names
+
+    def __setstate__(self, state):
+        for key, value in zip(self.__slots__, state):
+            setattr(self, key, value)
+
+
+class LazyTag(Tag):
+    """
+    A read result that keeps a view of the reply and only decodes the value (and data type) the first time
+    it's accessed.  ``raw`` is the undecoded value, which is enough to tell if a value has changed between reads
+    without decoding it, see `changed_tags`.
+    """
+    __slots__ = ('_reply', '_start', '_end', '_data_type', '_bit', '_decoder', '_decoded')
+
+    def __init__(self, tag, reply, start, end, data_type, bit=None, decoder=None):
+        """
+        :param reply: memoryview of the whole reply, shared by all the results of the same reply
+        :param start: offset of the value in the reply
+        :param end: offset of the end of the value in the reply
+        :param data_type: the data type code from the reply
+        :param bit: the bit number if the tag is a bit of an integer
+        :param decoder: callable(data_type, data, bit) that returns the decoded (value, data type)
+        """
+        self.tag = tag
+        self.error = None
+        self._reply = reply
+        self._start = start
+        self._end = end
+        self._data_type = data_type
+        self._bit = bit
+        self._decoder = decoder
+        self._decoded = False
+
+    @property
+    def raw(self):
+        """ the undecoded value, a memoryview of the reply """
+        return self._reply[self._start:self._end]
+
+    def _decode(self):
+        # value and type are properties here, the decoded result is stored in the slots defined by Tag
+        value, typ = self._decoder(self._data_type, self.raw, self._bit)
+        Tag.value.__set__(self, value)
+        Tag.type.__set__(self, typ)
+        self._decoded = True
+
+    @property
+    def value(self):
+        if not self._decoded:
+            self._decode()
+        return Tag.value.__get__(self)
+
+    @property
+    def type(self):
+        if not self._decoded:
+            self._decode()
+        return Tag.type.__get__(self)
+
+    def detach(self):
+        """
+        a copy that keeps only its own raw value instead of a view of the whole reply, to keep results for longer
+        without keeping the replies in memory, the value is copied too if it has been decoded
+        """
+        tag = LazyTag(self.tag, bytes(self.raw), 0, self._end - self._start, self._data_type, self._bit, self._decoder)
+        if self._decoded:
+            Tag.value.__set__(tag, Tag.value.__get__(self))
+            Tag.type.__set__(tag, Tag.type.__get__(self))
+            tag._decoded = True
+        return tag
+
+    def same_value(self, other):
+        """ True if `other` (another LazyTag) has the same raw value, the values are not decoded """
+        if self._bit is not None:
+            return bool(int.from_bytes(self.raw, 'little') & (1 << self._bit)) == \
+                   bool(int.from_bytes(other.raw, 'little') & (1 << other._bit))
+        return self.raw == other.raw
+
+
+def changed_tags(previous, current, deadband=None, percent=False):
+    """
+    compare two reads of the same tags and return the results in `current` that have changed (or weren't in
+    `previous`), lazy results are compared using the raw values so nothing needs to be decoded
+
+    :param previous: the results of the previous read, or a dict of {tag: result}
+    :param deadband: REAL and LREAL values only count as changed if they differ by more than the deadband, only
+                     the values with different raw values are decoded to be compared
+    :param percent: `deadband` is a percentage of the previous value instead of an absolute value
+    """
+    old = previous if isinstance(previous, dict) else {result.tag: result for result in previous}
+    changed = []
+    for result in current:
+        prev = old.get(result.tag)
+        if prev is None or result.error != prev.error:
+            changed.append(result)
+        elif isinstance(result, LazyTag) and isinstance(prev, LazyTag):
+            if not result.same_value(prev) and (deadband is None or result._data_type not in _FLOAT_TYPES or
+                                                _outside_deadband(prev.value, result.value, deadband, percent)):
+                changed.append(result)
+        elif result.value != prev.value:
+            if deadband is None or result.type not in ('REAL', 'LREAL') or \
+                    _outside_deadband(prev.value, result.value, deadband, percent):
+                changed.append(result)
+    return changed
+
+
+_FLOAT_TYPES = {DATA_TYPE['REAL'], DATA_TYPE['LREAL']}
+
+
+def _outside_deadband(old, new, deadband, percent):
+    if not isinstance(old, float) or not isinstance(new, float):
+        return old != new
+    limit = abs(old) * deadband / 100 if percent else deadband
+    return not abs(new - old) <= limit  # NaN is always a change
+
+
+class TagDatabase(dict):
+    """
+    The tag list, a dict of {tag name: TagInfo}.  Structure tags may be added before their structure definition
+    has been uploaded, the definition (``udt`` and ``template``) is then resolved the first time the tag is
+    looked up with ``[]`` or ``get``.  Iterating over the values does not resolve them.
+
+    The tag names are also kept sorted for prefix and wildcard queries (`match`, `prefixed`), and each structure
+    type gets an index of its members so the type, offset and size of a member path can be found without searching
+    the udt definitions (`lookup`).
+    """
+    __slots__ = ('_resolve', '_names', '_members')
+
+    def __init__(self, tags=(), resolve=None):
+        """
+        :param tags: dict or iterable of (tag name, TagInfo)
+        :param resolve: callable(TagInfo) that uploads the structure definition of a struct tag
+        """
+        super().__init__(tags)
+        self._resolve = resolve
+        self._names = None  # sorted tag names, rebuilt after the tags change
+        self._members = {}  # template instance id -> {member name: (data type, offset, size, bit, array length)}
+
+    def __getitem__(self, key):
+        tag = super().__getitem__(key)
+        if self._resolve is not None and tag['tag_type'] == 'struct' and not tag['udt']:
+            self._resolve(tag)
+        return tag
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        self._names = None
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._names = None
+        super().__delitem__(key)
+
+    def pop(self, *args):
+        self._names = None
+        return super().pop(*args)
+
+    def popitem(self):
+        self._names = None
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        self._names = None
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        self._names = None
+        super().update(*args, **kwargs)
+
+    def clear(self):
+        self._names = None
+        self._members.clear()
+        super().clear()
+
+    def __reduce__(self):
+        return dict, (dict(self), )  # pickled as a plain dict, without the resolver or indexes
+
+    def _sorted_names(self):
+        if self._names is None:
+            self._names = sorted(dict.keys(self))
+        return self._names
+
+    def prefixed(self, prefix):
+        """ the names of the tags starting with `prefix`, e.g. ``plc.tags.prefixed('Program:Line3.')`` """
+        names = self._sorted_names()
+        result = []
+        for i in range(bisect_left(names, prefix), len(names)):
+            if not names[i].startswith(prefix):
+                break
+            result.append(names[i])
+        return result
+
+    def match(self, pattern):
+        """
+        the tag names (and structure member paths) matching a wildcard pattern, ``*`` matches any characters
+        within a name and ``?`` a single character, e.g. ``plc.tags.match('Line*.Alarm*')``.  If the pattern has more
+        levels than a structure tag name, the members of the structure are matched with the rest of the pattern.
+        Array indexes are not expanded.
+        """
+        segments = _split_path(pattern)
+        regexes = [_glob_regex(segment) for segment in segments]
+        depth = 2 if pattern.startswith('Program:') else 1  # number of segments in a tag name
+        if len(segments) < depth:
+            return []
+        name_regex = re.compile(r'\.'.join(regexes[:depth]))
+        member_regexes = [re.compile(regex) for regex in regexes[depth:]]
+        literal = re.split(r'[*?]', '.'.join(segments[:depth]), 1)[0]
+
+        matches = []
+        for name in self.prefixed(literal):
+            if not name_regex.fullmatch(name):
+                continue
+            if not member_regexes:
+                matches.append(name)
+            elif dict.__getitem__(self, name)['tag_type'] == 'struct':
+                self._match_members(self[name]['udt'], name, member_regexes, matches)
+        return matches
+
+    def _match_members(self, udt, path, regexes, matches):
+        regex, rest = regexes[0], regexes[1:]
+        for member, (data_type, _, _, _, _) in self.member_index(udt).items():
+            if regex.fullmatch(member) and not is_hidden_member(member):
+                if not rest:
+                    matches.append(f'{path}.{member}')
+                elif isinstance(data_type, dict):
+                    self._match_members(data_type, f'{path}.{member}', rest, matches)
+
+    def member_index(self, udt):
+        """
+        the index of the members of a structure type: {member name: (data type, offset, size, bit, array length)},
+        data type is the udt definition for structure members and size is the size of one element for arrays
+        """
+        key = udt.get('template_instance_id', udt['name'])
+        index = self._members.get(key)
+        if index is None:
+            index = self._members[key] = {}
+            for member in udt['members']:
+                data_type = member['data_type']
+                if isinstance(data_type, dict):
+                    size = data_type['template']['structure_size']
+                else:
+                    size = DATA_FUNCTION_SIZE.get(data_type, 0)
+                index[member['name']] = (data_type, member['offset'], size, member['bit'], member['array'])
+        return index
+
+    def lookup(self, path):
+        """
+        find the type of a tag or member path, e.g. ``plc.tags.lookup('Motor[3].Drive.Speed')``
+
+        Indexes of multi-dimension tags are applied using the dimensions of the tag once they're known (they're
+        requested by `read_array`), otherwise indexes are applied assuming single dimension arrays.
+
+        :return: (data type, offset, size, bit) where data type is the type name or the udt definition for
+                 structures, offset is relative to the start of the tag, size is the size of the value (an element
+                 if `path` is an array), bit is the bit number for BOOL members or bits of integers.
+                 None if the tag or a member is not found.
+        """
+        base, *members = _split_path(path)
+        if base.startswith('Program:') and members:
+            base = f'{base}.{members.pop(0)}'
+        name, indexes = _split_indexes(base)
+        tag = self.get(name)
+        if tag is None:
+            return None
+        index = _flat_index(indexes, tag.dimensions or ())
+
+        if tag['tag_type'] == 'struct':
+            data_type = tag['udt']
+            size = data_type['template']['structure_size']
+        else:
+            data_type = tag['data_type']
+            size = DATA_FUNCTION_SIZE.get(data_type, 0)
+        offset = index * size
+        bit = tag['bit_position'] if data_type == 'BOOL' else None
+
+        for member in members:
+            if not isinstance(data_type, dict):
+                if member.isdigit() and data_type in ('SINT', 'INT', 'DINT', 'LINT', 'USINT', 'UINT', 'UDINT'):
+                    return 'BOOL', offset, size, int(member)  # bit of an integer
+                return None
+            name, index = _split_index(member)
+            entry = self.member_index(data_type).get(name)
+            if entry is None:
+                return None
+            data_type, member_offset, size, bit, _ = entry
+            offset += member_offset + index * size
+
+        return data_type, offset, size, bit
+
+    def elements(self, path):
+        """
+        the number of elements from an array tag or member to the end of the array, e.g. 10 for ``'Ary'`` and 7 for
+        ``'Ary[3]'`` if Ary is a DINT[10], used to read whole arrays without knowing their size.
+
+        :return: the number of elements, 1 if `path` isn't an array, None if the tag or a member is not found or the
+                 dimensions of the tag are unknown
+        """
+        base, *members = _split_path(path)
+        if base.startswith('Program:') and members:
+            base = f'{base}.{members.pop(0)}'
+        if not members:
+            name, indexes = _split_indexes(base)
+            tag = dict.get(self, name)  # the udt isn't needed, don't upload it for lazy_udts
+            if tag is None or tag.dimensions is None:
+                return None
+            length = 1
+            for dimension in tag.dimensions:
+                length *= dimension
+            return max(length - _flat_index(indexes, tag.dimensions), 0)
+
+        parent = self.lookup('.'.join([base, *members[:-1]]))
+        if parent is None or not isinstance(parent[0], dict):
+            return None
+        name, index = _split_index(members[-1])
+        entry = self.member_index(parent[0]).get(name)
+        if entry is None:
+            return None
+        return max((entry[4] or 1) - index, 0)
+
+    def base_tag(self, path):
+        """ the TagInfo of the tag of a tag or member path, without uploading its udt, None if not found """
+        base, *members = _split_path(path)
+        if base.startswith('Program:') and members:
+            base = f'{base}.{members[0]}'
+        return dict.get(self, _split_index(base)[0])
+
+
+def _split_path(path):
+    """ split a tag path on the '.' between names, ignoring '.' inside brackets """
+    return re.findall(r'(?:[^.\[]|\[[^\]]*\])+', path)
+
+
+def _split_index(name):
+    """ 'Tag[3]' -> ('Tag', 3), 'Tag' -> ('Tag', 0) """
+    if name.endswith(']'):
+        name, _, index = name[:-1].partition('[')
+        index = index.split(',')[0]
+        return name, int(index) if index.isdigit() else 0
+    return name, 0
+
+
+def _split_indexes(name):
+    """ 'Tag[1,2]' -> ('Tag', [1, 2]), 'Tag' -> ('Tag', []) """
+    if name.endswith(']'):
+        name, _, indexes = name[:-1].partition('[')
+        return name, [int(index) if index.strip().isdigit() else 0 for index in indexes.split(',')]
+    return name, []
+
+
+def _flat_index(indexes, dimensions):
+    """ the index in the elements of an array of `dimensions` (row-major, like the controller stores them) """
+    index = 0
+    for i, value in enumerate(indexes):
+        index = index * (dimensions[i] if i < len(dimensions) else 1) + value
+    for dimension in dimensions[len(indexes):] if indexes else ():
+        index *= dimension
+    return index
+
+
+def _glob_regex(pattern):
+    return ''.join('[^.]*' if c == '*' else '[^.]' if c == '?' else re.escape(c) for c in pattern)
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+#
+# udt.py - Compiled layouts for decoding and encoding the byte image of user-defined structures
+#
+# Copyright (c) 2019 Ian Ottoway <ian@ottoway.dev>
+# Copyright (c) 2014 Agostino Ruscito <ruscito@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+import struct
+
+from . import DataError
+from .bytes_ import ARRAY_TYPECODE
+
+
+# the predefined STRING type, used to decode strings when the template has not been uploaded
+STRING_UDT = {
+    'name': 'STRING',
+    'members': [
+        {'name': 'LEN', 'data_type': 'DINT', 'offset': 0, 'array': 0, 'bit': None},
+        {'name': 'DATA', 'data_type': 'SINT', 'offset': 4, 'array': 82, 'bit': None},
+    ],
+    'template': {'structure_size': 88, 'structure_handle': 0x0fce},
+}
+
+
+def decode_string(data, offset=0, size=None):
+    """
+    decode a Logix string (a DINT LEN followed by the SINT array DATA) directly from the structure image
+
+    :param size: the length of the DATA array, if None it's assumed DATA takes the rest of `data`
+    """
+    length = struct.unpack_from('<i', data, offset)[0]
+    start = offset + 4
+    capacity = len(data) - start if size is None else size
+    return bytes(data[start:start + max(0, min(length, capacity))]).decode('iso-8859-1')
+
+
+def encode_string(value, size, data=None, offset=0):
+    """ encode `value` into the image of a Logix string with a DATA array of `size` characters """
+    if data is None:
+        data = bytearray(offset + 4 + size)
+    try:
+        encoded = value.encode('iso-8859-1')[:size]
+    except (AttributeError, UnicodeError) as err:
+        raise DataError(f'Unable to encode string: {err}')
+    struct.pack_into('<i', data, offset, len(encoded))
+    data[offset + 4:offset + 4 + size] = encoded.ljust(size, b'\x00')
+    return data
+
+
+def is_hidden_member(name):
+    """ BOOL host members (ZZZZZZZZZZ...) and AOI/system members (__...) are not visible to the user """
+    return name.startswith('ZZZZZZZZZZ') or name.startswith('__')
+
+
+class StructLayout:
+    """
+    A template compiled into a single ``struct.Struct`` covering all of the atomic members, plus the extra
+    steps needed for BOOL members (a bit of a hidden host SINT) and nested structures.  Compiled once per
+    template, then used to decode the value of a structure in one pass over the reply data and to encode
+    values back into the structure's byte image for writing.
+    """
+    __slots__ = ('name', 'size', 'handle', 'string_size', '_struct', '_atomics', '_bools', '_structs', '_order')
+
+    def __init__(self, udt, layouts=None):
+        """
+        :param udt: a udt definition as created by ``LogixDriver._build_udt``
+        :param layouts: dict of template instance id -> compiled layout, used to share nested layouts
+        """
+        layouts = {} if layouts is None else layouts
+        template = udt.get('template') or {}
+        self.name = udt['name']
+        self.size = template.get('structure_size', 0)
+        self.handle = template.get('structure_handle')
+        self._atomics = []  # (name, array length, offset, type code), in the order of the struct fields
+        self._bools = []  # (name, offset of the host, bit)
+        self._structs = []  # (name, offset, array length, layout)
+        self._order = []
+
+        fmt = ['<']
+        position = 0
+        members = sorted((m for m in udt['members'] if not is_hidden_member(m['name'])), key=lambda m: m['offset'])
+        for member in members:
+            name, data_type, offset, array_len = member['name'], member['data_type'], member['offset'], member['array']
+            if isinstance(data_type, dict):
+                instance_id = data_type.get('template_instance_id')
+                layout = layouts.get(instance_id)
+                if layout is None:
+                    layout = layouts[instance_id] = StructLayout(data_type, layouts)
+                self._structs.append((name, offset, array_len, layout))
+            elif data_type == 'BOOL' and not array_len:
+                self._bools.append((name, offset, member['bit']))
+            elif data_type in ARRAY_TYPECODE:
+                if offset < position:  # overlapping member, not expected in a Logix template
+                    continue
+                if offset > position:
+                    fmt.append(f'{offset - position}x')
+                code = ARRAY_TYPECODE[data_type]
+                fmt.append(f'{array_len or 1}{code}')
+                position = offset + struct.calcsize(f'<{array_len or 1}{code}')
+                self._atomics.append((name, array_len, offset, code))
+            else:
+                continue  # type not supported, leave it out of the value
+            self._order.append(name)
+
+        if self.size > position:
+            fmt.append(f'{self.size - position}x')
+        self._struct = struct.Struct(''.join(fmt))
+        self.size = max(self.size, self._struct.size)
+        if self._order == [atomic[0] for atomic in self._atomics]:
+            self._order = None  # already in member order, no need to reorder the decoded value
+
+        # strings (STRING or a custom length string type) are decoded to/encoded from str instead of a dict
+        self.string_size = None
+        atomics = [(name, offset, code) for name, _, offset, code in self._atomics]
+        if not self._bools and not self._structs and atomics == [('LEN', 0, 'i'), ('DATA', 4, 'b')]:
+            self.string_size = self._atomics[1][1]
+
+    def decode(self, data, offset=0):
+        """ decode the structure starting at `offset` of `data` into a dict of {member: value} """
+        if self.string_size is not None:
+            return decode_string(data, offset, self.string_size)
+        try:
+            values = self._struct.unpack_from(data, offset)
+        except struct.error as err:
+            raise DataError(f'Unable to decode {self.name}: {err}')
+
+        result = {}
+        idx = 0
+        for name, array_len, _, _ in self._atomics:
+            if array_len:
+                result[name] = list(values[idx:idx + array_len])
+                idx += array_len
+            else:
+                result[name] = values[idx]
+                idx += 1
+
+        for name, host, bit in self._bools:
+            result[name] = bool(data[offset + host] & (1 << bit))
+
+        for name, member_offset, array_len, layout in self._structs:
+            start = offset + member_offset
+            if array_len:
+                result[name] = [layout.decode(data, start + (i * layout.size)) for i in range(array_len)]
+            else:
+                result[name] = layout.decode(data, start)
+
+        if self._order is not None:
+            result = {name: result[name] for name in self._order}
+
+        return result
+
+    def encode(self, value, data=None, offset=0):
+        """
+        encode a dict of {member: value} into the byte image of the structure, members missing from `value`
+        keep the value they have in `data` (zeros if `data` is not provided)
+
+        :param value: dict of member values, nested structures as dicts and arrays as lists
+        :param data: bytearray containing the current image of the structure
+        :param offset: offset of the structure in `data`
+        :return: the bytearray containing the encoded structure
+        """
+        if data is None:
+            data = bytearray(offset + self.size)
+        if self.string_size is not None and isinstance(value, str):
+            return encode_string(value, self.string_size, data, offset)
+        try:
+            for name, array_len, member_offset, code in self._atomics:
+                if name in value:
+                    if array_len:
+                        values = value[name]
+                        if len(values) > array_len:
+                            raise DataError(f'Too many values for {self.name}.{name}, array length is {array_len}')
+                        struct.pack_into(f'<{len(values)}{code}', data, offset + member_offset, *values)
+                    else:
+                        struct.pack_into(f'<{code}', data, offset + member_offset, value[name])
+
+            for name, host, bit in self._bools:
+                if name in value:
+                    if value[name]:
+                        data[offset + host] |= (1 << bit)
+                    else:
+                        data[offset + host] &= ~(1 << bit) & 0xff
+
+            for name, member_offset, array_len, layout in self._structs:
+                if name in value:
+                    start = offset + member_offset
+                    if array_len:
+                        for i, val in enumerate(value[name][:array_len]):
+                            layout.encode(val, data, start + (i * layout.size))
+                    else:
+                        layout.encode(value[name], data, start)
+        except (struct.error, TypeError) as err:
+            raise DataError(f'Unable to encode {self.name}: {err}')
+
+        return data
+
+    def is_complete(self, value):
+        """ True if `value` includes every member, so the encoded image does not depend on the current value """
+        if self.string_size is not None and isinstance(value, str):
+            return True
+
+        for name, array_len, _, _ in self._atomics:
+            if name not in value or (array_len and len(value[name]) != array_len):
+                return False
+
+        for name, _, _ in self._bools:
+            if name not in value:
+                return False
+
+        for name, _, array_len, layout in self._structs:
+            if name not in value:
+                return False
+            if array_len:
+                if len(value[name]) != array_len or not all(layout.is_complete(v) for v in value[name]):
+                    return False
+            elif not layout.is_complete(value[name]):
+                return False
+
+        return True
+
+
+STRING_LAYOUT = StructLayout(STRING_UDT)